@@ -5,6 +5,7 @@
 using System;
 using System.Collections.Generic;
 using System.Collections.Specialized;
+using System.Globalization;
 using System.Linq;
 using System.Net;
 using System.Net.Http;
@@ -34,28 +35,46 @@ namespace Datadog.Unity.Tests.Integration
             await _client.GetAsync($"{_endpoint}/reset");
         }
 
-        public async Task<List<MockServerLog>> PollRequests(TimeSpan duration, Func<List<MockServerLog>, bool> parseRequests)
+        // `query` optionally filters and projects recorded requests on the mock server side, for example
+        // "path=/api/v2/logs&fields=method,query_string,headers,decompressed_data".
+        public async Task<List<MockServerLog>> PollRequests(TimeSpan duration, Func<List<MockServerLog>, bool> parseRequests, string query = null)
         {
             var timeoutTime = DateTime.Now + duration;
+            var contractResolver = new DefaultContractResolver
+            {
+                NamingStrategy = new SnakeCaseNamingStrategy(),
+            };
 
+            // Only fetch requests recorded since the last poll, and let the server hold the
+            // connection until new requests arrive instead of polling on a fixed interval.
+            var serverLog = new List<MockServerLog>();
+            var cursor = "0";
             var stopPolling = false;
             do
             {
-                var inspect = await _client.GetAsync($"{_endpoint}/inspect_requests/");
+                var wait = Math.Max(0, Math.Min(5.0, (timeoutTime - DateTime.Now).TotalSeconds));
+                var inspectUrl = $"{_endpoint}/inspect_requests/?since={cursor}&wait={wait.ToString("0.0", CultureInfo.InvariantCulture)}";
+                if (query != null)
+                {
+                    inspectUrl += $"&{query}";
+                }
+
+                var inspect = await _client.GetAsync(inspectUrl);
                 if (inspect.StatusCode == HttpStatusCode.OK)
                 {
                     try
                     {
                         var content = await inspect.Content.ReadAsStringAsync();
-                        var contractResolver = new DefaultContractResolver
-                        {
-                            NamingStrategy = new SnakeCaseNamingStrategy(),
-                        };
-                        var serverLog = JsonConvert.DeserializeObject<List<MockServerLog>>(content, new JsonSerializerSettings()
+                        var newLogs = JsonConvert.DeserializeObject<List<MockServerLog>>(content, new JsonSerializerSettings()
                         {
                             ContractResolver = contractResolver,
                         });
+                        if (inspect.Headers.TryGetValues("X-Mock-Server-Cursor", out var cursorValues))
+                        {
+                            cursor = cursorValues.First();
+                        }
 
+                        MergeLogs(serverLog, newLogs);
                         if (parseRequests(serverLog))
                         {
                             return serverLog;
@@ -64,15 +83,34 @@ namespace Datadog.Unity.Tests.Integration
                     catch (Exception e)
                     {
                         Debug.Log($"Caught an exception deserializing response: {e}.");
+                        await Task.Delay(500);
                     }
                 }
-
-                await Task.Delay(500);
+                else
+                {
+                    await Task.Delay(500);
+                }
             }
             while (!stopPolling && DateTime.Now < timeoutTime);
 
             return new List<MockServerLog>();
         }
+
+        private static void MergeLogs(List<MockServerLog> serverLog, List<MockServerLog> newLogs)
+        {
+            foreach (var newLog in newLogs)
+            {
+                var existing = serverLog.FirstOrDefault(l => l.Endpoint == newLog.Endpoint);
+                if (existing == null)
+                {
+                    serverLog.Add(newLog);
+                }
+                else
+                {
+                    existing.Requests.AddRange(newLog.Requests);
+                }
+            }
+        }
     }
 
     public class MockServerLog
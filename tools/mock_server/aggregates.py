@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import threading
+import zlib
+from typing import Optional
+
+# Counters broken down by key, by name of the summary field they are read from (see `Schema.summary()`):
+keyed_counters = ['events', 'records', 'logs']  # RUM events by type, SR records by type, logs by status
+
+
+def request_counts(request) -> dict:
+    """
+    Contribution of `request` to running aggregates when it is recorded, as `{counter name: value}`: `requests`,
+    `bytes` (as sent), `decompressed_bytes`, `events/<type>`, `records/<type>` and `logs/<status>`, read from
+    the payload as parsed at ingest. Validation results are counted separately, see `validation_counts()`.
+    """
+    body = request.body
+    if body.decompressed_size is None:
+        try:
+            _ = body.decompressed_data  # sets `decompressed_size`
+        except (OSError, EOFError, zlib.error):
+            pass  # not decompressible, counted as `0` decompressed bytes (it is still shown as RAW)
+    counts = {
+        'requests': 1,
+        'bytes': request.size,
+        'decompressed_bytes': body.decompressed_size or 0,
+    }
+    for schema in request.schemas:
+        summary = schema.summary(validate=False)
+        for name in keyed_counters:
+            for key, count in summary.get(name, {}).items():
+                counts[f'{name}/{key}'] = counts.get(f'{name}/{key}', 0) + count
+    return counts
+
+
+def validation_counts(request) -> dict:
+    """
+    Contribution of `request` to `validation/passed` and `validation/failed` (number of validated events, records
+    and segments). Payload is validated if it was not already. Both counters are returned, even if `0`, so
+    `is_validation_counted()` tells apart requests whose validation results were added to aggregates.
+    """
+    counts = {'validation/passed': 0, 'validation/failed': 0}
+    for schema in request.schemas:
+        summary = schema.summary(validate=True)
+        failed = summary.get('invalid_events', 0) + summary.get('invalid_records', 0)
+        validated = sum(summary.get('events', {}).values()) if 'invalid_events' in summary else 0
+        validated += sum(summary.get('records', {}).values()) if 'invalid_records' in summary else 0
+        if 'valid_segment' in summary:
+            validated += 1
+            failed += 0 if summary['valid_segment'] else 1
+        counts['validation/passed'] += validated - failed
+        counts['validation/failed'] += failed
+    return counts
+
+
+def validation_counts_or_none(request) -> Optional[dict]:
+    """
+    `validation_counts()`, or `None` if validation failed (reported, as it runs in the background).
+    """
+    try:
+        return validation_counts(request)
+    except Exception as error:
+        print(f'⚠️ Could not validate request {request.id}: {error}')
+        return None
+
+
+def is_validation_counted(counts: dict) -> bool:
+    """
+    Whether `counts` of a request include `validation_counts()`.
+    """
+    return 'validation/passed' in counts
+
+
+class Aggregates:
+    """
+    Running totals of `request_counts()` over stored requests: counts of recorded requests are added
+    when they are recorded (`validation_counts()` when they are counted) and subtracted when they are evicted,
+    so reading totals costs the same whatever the number of stored requests.
+    """
+    def __init__(self):
+        self._totals = {}  # counter name -> value
+        self._lock = threading.Lock()
+
+    def add(self, counts: dict, sign: int = 1):
+        with self._lock:
+            for name, value in counts.items():
+                if total := self._totals.get(name, 0) + sign * value:
+                    self._totals[name] = total
+                else:
+                    self._totals.pop(name, None)
+
+    def subtract(self, counts: dict):
+        self.add(counts, sign=-1)
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+
+    def value(self, name: str) -> int:
+        return self._totals.get(name, 0)
+
+    def as_json(self) -> dict:
+        with self._lock:
+            return aggregates_json(self._totals)
+
+
+def aggregates_json(totals: dict) -> dict:
+    """
+    JSON representation of `{counter name: value}` totals, with keyed counters (e.g. `events/view`) nested.
+    """
+    obj = {
+        'requests': totals.get('requests', 0),
+        'bytes': totals.get('bytes', 0),
+        'decompressed_bytes': totals.get('decompressed_bytes', 0),
+    }
+    for name in keyed_counters:
+        obj[name] = {}
+    obj['validation'] = {'passed': totals.get('validation/passed', 0), 'failed': totals.get('validation/failed', 0)}
+    for name, value in totals.items():
+        prefix, _, key = name.partition('/')
+        if prefix in keyed_counters and value:
+            obj[prefix][key] = value
+    return obj
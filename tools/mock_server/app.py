@@ -7,131 +7,561 @@
 # -----------------------------------------------------------
 
 import argparse
+import atexit
 import os
 import json
 
 import datetime
-from hashlib import sha1
+import itertools
+import math
+import threading
+import time
 import sys
-from typing import Optional
-from dataclasses import dataclass, is_dataclass, asdict
-from flask import Flask, request, Request, render_template, url_for, redirect
+from typing import Callable, Optional, Union
+from collections import deque
+from dataclasses import dataclass
+from flask import Flask, request, Request, render_template, url_for, redirect, g
 import flask
+from werkzeug.serving import is_running_from_reloader
 from schema_update import schemas_path_exists, update_schemas
 from schemas.schema import Schema
+from schemas.request_body import RequestBody, configure_compact_storage
 from schemas.raw import RAWSchema
+from schemas.logs import LogsSchema
 from schemas.rum import RUMSchema
 from schemas.session_replay import SRSchema
+from schemas.derived_views import configure_derived_views
+from request_filter import RequestFilter
+from event_index import EventIndex, EventQuery
+from aggregates import Aggregates, is_validation_counted, request_counts, validation_counts, \
+    validation_counts_or_none
+from retention import RetentionPolicy
+from request_store import RequestStore, endpoint_hash
+from sqlite_store import SQLiteRequestStore
+from journal import Journal, JournalEntry
+from ingest import IngestQueue
+from metrics import metrics, received_requests, received_bytes, render_seconds
+from request_stream import RequestStream, server_sent_event
 from server_address import get_best_server_address, get_localhost
 from templates.components.card import Card, CardTab
+from templates.components.pagination import Pagination
+from wsgi_server import serve
+from validation.validation import configure_validation_pool
 
 app = Flask(__name__)
 
 @dataclass()
 class GenericRequest:
+    __slots__ = (
+        'id', 'method', 'path', 'query_string', 'date', 'content_type', 'content_length', 'schemas',
+        'body', 'size', 'stored_size', '_json_fragment', '_counts'
+    )
+
+    id: int
     method: str
     path: str
     query_string: str
     date: datetime
     content_type: str
     content_length: Optional[int]
-    data_as_text: str
     schemas: [Schema]
 
-    def __init__(self, r: Request):
-        self.method = r.method
-        self.path = r.path
-        self.query_string = f'?{r.query_string.decode("utf-8")}' if r.query_string else ''
-        self.date = datetime.datetime.now()
-        self.content_type = r.content_type
-        self.content_length = r.content_length
-        self.data_as_text = r.get_data(as_text=True)
-        self.schemas = schemas_for_request(r)
+    def __init__(self, method: str, path: str, query_string: str, date: datetime,
+                 content_type: Optional[str], content_length: Optional[int], body: RequestBody, id: int = 0):
+        self.id = id  # assigned when the request is recorded, see `EndpointRegistry.record()`
+        self.method = sys.intern(method)
+        self.path = sys.intern(path)
+        self.query_string = query_string
+        self.date = date
+        self.content_type = sys.intern(content_type) if content_type else content_type
+        self.content_length = content_length
+        self.body = body
+        self.size = body.size  # bytes as sent
+        self.stored_size = body.size  # bytes counted by retention policy, set when the request is recorded
+        self.schemas = schemas_for_request(method=method, path=path, body=body)
+        self._json_fragment = None
+        self._counts = None
+
+    @staticmethod
+    def from_request(r: Request) -> 'GenericRequest':
+        return GenericRequest(**GenericRequest.capture(r=r))
+
+    @staticmethod
+    def capture(r: Request) -> dict:
+        """
+        Arguments of `GenericRequest()` read from `r`: only headers and original bytes, no decoding or parsing.
+        """
+        return {
+            "method": r.method,
+            "path": r.path,
+            "query_string": f'?{r.query_string.decode("utf-8")}' if r.query_string else '',
+            "date": datetime.datetime.now(),
+            "content_type": r.content_type,
+            "content_length": r.content_length,
+            "body": RequestBody.from_request(r),
+        }
+
+    @staticmethod
+    def from_journal(entry: JournalEntry) -> 'GenericRequest':
+        return GenericRequest.from_metadata(id=entry.seq, metadata=entry.metadata, data=entry.read_body)
+
+    @staticmethod
+    def from_metadata(id: int, metadata: dict, data: Union[bytes, Callable[[], bytes]]) -> 'GenericRequest':
+        """
+        Request read back from storage: `metadata` as returned by `journal_metadata()` and `data` as accepted
+        by `RequestBody`.
+        """
+        headers = [tuple(h.split(': ', 1)) for h in metadata['headers']]
+        return GenericRequest(
+            id=id,
+            method=metadata['method'],
+            path=metadata['path'],
+            query_string=metadata['query_string'],
+            date=datetime.datetime.fromisoformat(metadata['date']),
+            content_type=metadata['content_type'],
+            content_length=metadata['content_length'],
+            body=RequestBody(headers=headers, data=data, size=metadata['size'])
+        )
+
+    def journal_metadata(self) -> dict:
+        """
+        Everything but the body, as written to the journal (see `from_metadata()`).
+        """
+        return {
+            "method": self.method,
+            "path": self.path,
+            "query_string": self.query_string,
+            "date": self.date.isoformat(),
+            "content_type": self.content_type,
+            "content_length": self.content_length,
+            "headers": list(self.body.headers),
+            "size": self.size,
+        }
+
+    @property
+    def data_as_text(self) -> str:
+        return self.body.data_as_text
 
     def follow_url(self, schema: Schema):
         return url_for(
             'inspect_request',
             schema_name=schema.name,
-            endpoint_hash=self.endpoint_hash(),
-            request_hash=self.hash()
+            endpoint_hash=endpoints.endpoint_hash(method=self.method, path=self.path),
+            request_id=self.id
         )
 
-    def hash(self) -> str:
-        meta = f'{self.method} {self.path} {self.date}'.encode('utf-8')
-        body = self.data_as_text.encode('utf-8')
-        return sha1(meta + body).hexdigest()
-
-    def endpoint_hash(self) -> str:
-        return sha1(f'{self.method} {self.path}'.encode('utf-8')).hexdigest()
-
     def schema_with_name(self, name: str):
         return next((s for s in self.schemas if s.name == name), None)
 
+    def as_json(self) -> dict:
+        """
+        JSON representation of the request, as returned by `/inspect_requests` (with RAW schema only,
+        and parsed logs for log batches).
+        """
+        obj = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query_string": self.query_string,
+            "date": str(self.date),
+            "content_type": self.content_type,
+            "content_length": self.content_length,
+            "data_as_text": self.data_as_text,
+            "schemas": [s.as_json() for s in self.schemas if isinstance(s, RAWSchema)],
+        }
+        if logs_schema := self.schema_with_name('logs'):
+            obj["logs"] = logs_schema.as_json()
+        obj["timings"] = self.timings
+        return obj
+
+    def json_fragment(self) -> str:
+        """
+        `as_json()` serialized. Recorded requests don't change, so all but `timings` is serialized once,
+        on first use, and reused by all later `/inspect_requests` responses (except in compact storage mode,
+        where it is not kept). `timings` are serialized each time, as stages run when the request is inspected.
+        """
+        fragment = self._json_fragment
+        if fragment is None:
+            obj = self.as_json()
+            del obj['timings']
+            fragment = json.dumps(obj)
+            if not self.body.is_compact:
+                self._json_fragment = fragment
+        return f'{fragment[:-1]}, "timings": {json.dumps(self.timings)}}}'
+
+    def load(self) -> 'GenericRequest':
+        """
+        Returns this request, like `load()` of request references sent by stores to `on_event`.
+        """
+        return self
+
+    @property
+    def counts(self) -> dict:
+        """
+        Contribution of this request to running aggregates (see `request_counts()`), computed once.
+        `validation_counts()` are added to it when they are counted.
+        """
+        if self._counts is None:
+            self._counts = request_counts(request=self)
+        return self._counts
+
+    @property
+    def timings(self) -> dict:
+        """
+        Durations (in milliseconds) of processing stages run so far for this request: body read, decompression,
+        decoding, parsing and validation (by schema file).
+        """
+        return {stage: round(duration * 1000, 3) for stage, duration in list(self.body.timings.items())}
+
+    def summary(self, validate: bool) -> dict:
+        return {
+            "id": self.id,
+            "endpoint_hash": endpoints.endpoint_hash(method=self.method, path=self.path),
+            "method": self.method,
+            "path": self.path,
+            "date": str(self.date),
+            "content_length": self.content_length or 0,
+            "schemas": {s.name: s.summary(validate=validate) for s in self.schemas},
+        }
+
 
-@dataclass()
 class GenericEndpoint:
+    """
+    Requests recorded for one endpoint. Changes are made by `EndpointRegistry` (with its lock held) and
+    guarded by the endpoint's own lock, so readers only wait for changes to this endpoint, never for ingest
+    of requests to other endpoints or for slow renders.
+    """
     method: str
     path: str
-    requests: [GenericRequest]  # all requests sent to this endpoint
     schemas: [Schema]
+    evicted_requests: int  # number of requests dropped by retention policy
+    evicted_bytes: int
+    aggregates: Aggregates  # of stored requests
+
+    def __init__(self, method: str, path: str, schemas: [Schema]):
+        self.method = method
+        self.path = path
+        self.schemas = schemas
+        self.aggregates = Aggregates()
+        self.evicted_requests = 0
+        self.evicted_bytes = 0
+        self.stored_bytes = 0
+        self._hash = endpoint_hash(method=self.method, path=self.path)
+        self._requests = deque()  # oldest first
+        self._requests_by_id = {}
+        self._lock = threading.Lock()
+
+    @property
+    def requests(self) -> [GenericRequest]:
+        """
+        Snapshot of requests sent to this endpoint (oldest first), safe to iterate while new requests are recorded.
+        """
+        with self._lock:
+            return list(self._requests)
 
     def name(self):
         return f'{self.method} {self.path}'
 
+    def add_request(self, request: GenericRequest):
+        with self._lock:
+            self._requests.append(request)
+            self._requests_by_id[request.id] = request
+            self.stored_bytes += request.stored_size
+            self.aggregates.add(request.counts)
+
+    def oldest_request(self) -> Optional[GenericRequest]:
+        with self._lock:
+            return self._requests[0] if self._requests else None
+
+    def evict_oldest_request(self) -> GenericRequest:
+        with self._lock:
+            request = self._requests.popleft()
+            del self._requests_by_id[request.id]
+            self.stored_bytes -= request.stored_size
+            self.aggregates.subtract(request.counts)
+            self.evicted_requests += 1
+            self.evicted_bytes += request.size
+            return request
+
+    def request_with_id(self, id: int) -> Optional[GenericRequest]:
+        return self._requests_by_id.get(id)
+
+    def requests_page(self, offset: int, limit: int) -> [GenericRequest]:
+        """
+        Up to `limit` requests (oldest first), skipping the `offset` oldest ones.
+        """
+        with self._lock:
+            return list(itertools.islice(self._requests, offset, offset + limit))
+
+    def requests_in_range(self, after_id: int, until_id: int) -> [GenericRequest]:
+        """
+        Requests with `after_id < id <= until_id`, found by scanning from the most recent request.
+        """
+        requests = []
+        with self._lock:
+            for r in reversed(self._requests):
+                if r.id <= after_id:
+                    break
+                if r.id <= until_id:
+                    requests.append(r)
+        requests.reverse()
+        return requests
+
+    def clear_requests(self):
+        with self._lock:
+            self._requests.clear()
+            self._requests_by_id.clear()
+            self.stored_bytes = 0
+            self.aggregates.clear()
+            self.evicted_requests = 0
+            self.evicted_bytes = 0
+
     def requests_count(self):
-        return len(self.requests)
+        return len(self._requests)
 
     def bytes_received(self):
-        return sum(map(lambda r: r.content_length or 0, self.requests))
+        return self.aggregates.value('bytes')
 
     def follow_url(self, schema: Schema):
         return url_for('inspect_endpoint', schema_name=schema.name, endpoint_hash=self.hash())
 
     def hash(self) -> str:
-        return sha1(f'{self.method} {self.path}'.encode('utf-8')).hexdigest()
+        return self._hash
 
     def schema_with_name(self, name: str):
         return next((s for s in self.schemas if s.name == name), None)
 
 
-def schemas_for_request(r: Request) -> [Schema]:
-    schemas: [Schema] = []
+class EndpointRegistry(RequestStore):
+    """
+    Known endpoints, indexed by `(method, path)` and by endpoint hash. The hash of each
+    endpoint is computed once, when the endpoint is registered.
+
+    Recording, eviction and `clear()` are serialized by the registry lock. Readers don't take it: the list of
+    endpoints is copy-on-write and each endpoint guards its requests with its own lock.
+    RUM events of stored requests are indexed in an `EventIndex`, for `query_events()`.
+    """
+    retention: RetentionPolicy
+    journal: Optional[Journal]  # if set, recorded requests are also written to disk
+    stored_requests: int
+    stored_bytes: int
+    evicted_requests: int  # number of requests dropped by retention policy, on all endpoints
+    evicted_bytes: int
+    aggregates: Aggregates  # of stored requests, on all endpoints
+    _endpoints: [GenericEndpoint]  # in order of registration
+    _by_key: dict  # (method, path) -> GenericEndpoint
+    _by_hash: dict  # hash -> GenericEndpoint
+
+    def __init__(self, retention: Optional[RetentionPolicy] = None):
+        self.on_event = None
+        self.has_listeners = None
+        self._last_request_id = 0
+        self.retention = retention or RetentionPolicy()
+        self.journal = None
+        self.stored_requests = 0
+        self.stored_bytes = 0
+        self.evicted_requests = 0
+        self.evicted_bytes = 0
+        self.aggregates = Aggregates()
+        self._endpoints = []
+        self._by_key = {}
+        self._by_hash = {}
+        self._ingest_order = deque()  # (endpoint, request) of all stored requests, oldest first
+        self._unvalidated = deque()  # (endpoint, request) of stored requests not in validation aggregates yet
+        self._request_ids = itertools.count(start=1)  # monotonic, not reset with `/reset`
+        self._new_requests = threading.Condition()
+        self._event_index = EventIndex()
+
+    @property
+    def last_request_id(self) -> int:
+        return self._last_request_id
 
-    if RAWSchema.matches(r.method, r.path):
-        schemas.append(RAWSchema(request=r))
+    def __iter__(self):
+        return iter(self._endpoints)
 
-    if RUMSchema.matches(r.method, r.path):
-        schemas.append(RUMSchema(request=r))
+    def __len__(self):
+        return len(self._endpoints)
 
-    if SRSchema.matches(r.method, r.path):
-        schemas.append(SRSchema(request=r))
+    def endpoint(self, method: str, path: str) -> Optional[GenericEndpoint]:
+        return self._by_key.get((method, path))
 
-    return schemas
+    def endpoint_with_hash(self, hash: str) -> Optional[GenericEndpoint]:
+        return self._by_hash.get(hash)
 
+    def endpoint_hash(self, method: str, path: str) -> str:
+        if endp := self.endpoint(method=method, path=path):
+            return endp.hash()
+        return endpoint_hash(method=method, path=path)
 
-endpoints: [GenericEndpoint] = []
+    def register(self, endpoint: GenericEndpoint):
+        self._endpoints = self._endpoints + [endpoint]  # copy-on-write, so readers can iterate without locking
+        self._by_key[(endpoint.method, endpoint.path)] = endpoint
+        self._by_hash[endpoint.hash()] = endpoint
 
-class DataClassJsonEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if is_dataclass(obj):
-            return asdict(obj)
-        as_json_method = getattr(obj, "as_json", None)
-        if callable(as_json_method):
-            return obj.as_json()
-        if isinstance(obj, datetime.datetime):
-            return str(obj)
-        return super().default(obj)
+    def record(self, request: GenericRequest) -> bool:
+        """
+        Assigns the next ID to `request` and adds it to its endpoint.
+        Returns `True` if the request was sent to a new endpoint.
+        """
+        _ = request.counts  # computed before taking the lock, as it parses the payload
+        with self._new_requests:
+            request.id = next(self._request_ids)
+            if self.journal:  # appended under the lock, so the journal is in ID order
+                self.journal.append(
+                    seq=request.id,
+                    endpoint=f'{request.method} {request.path}',
+                    timestamp=request.date.timestamp(),
+                    metadata=request.journal_metadata(),
+                    body=request.body.data,
+                    on_written=lambda entry: request.body.offload(read_data=entry.read_body)
+                )
+            is_new_endpoint = self._add(request)
+        self._emit(('request', request))
+        return is_new_endpoint
+
+    def restore(self, request: GenericRequest):
+        """
+        Adds a request read back from the journal, keeping its ID.
+        """
+        _ = request.counts
+        with self._new_requests:
+            self._request_ids = itertools.count(start=request.id + 1)
+            self._add(request)
+
+    def _add(self, request: GenericRequest) -> bool:
+        """
+        Adds `request` to its endpoint and enforces the retention policy. Must be called with the lock held.
+        """
+        # Views decoded and parsed so far (e.g. to count events) are kept with the request, unless in compact mode:
+        request.stored_size = request.size + request.body.views_size
+        is_new_endpoint = False
+        if not (endp := self.endpoint(method=request.method, path=request.path)):
+            schemas = [c for c in schema_classes if c.matches(request.method, request.path)]  # even if not parsed
+            endp = GenericEndpoint(method=request.method, path=request.path, schemas=schemas)
+            self.register(endp)
+            is_new_endpoint = True
+        endp.add_request(request)
+        self._event_index.add(request)
+        self._ingest_order.append((endp, request))
+        self.stored_requests += 1
+        self.stored_bytes += request.stored_size
+        self.aggregates.add(request.counts)
+        if not is_validation_counted(request.counts):
+            self._unvalidated.append((endp, request))
+            if len(self._unvalidated) > 2 * self.stored_requests + 100:
+                # Drop evicted requests (amortized, so recording stays O(1) if validation is never counted)
+                self._unvalidated = deque((e, r) for e, r in self._unvalidated if e.request_with_id(r.id) is r)
+        self._enforce_endpoint_retention(endp)
+        self._enforce_retention()
+        self._last_request_id = request.id
+        self._new_requests.notify_all()
+        return is_new_endpoint
+
+    def enforce_retention(self):
+        """
+        Evicts requests older than the retention policy allows. Other limits are enforced when requests are recorded.
+        """
+        if self.retention.max_age is not None:
+            with self._new_requests:
+                self._enforce_retention()
+
+    def clear(self):
+        with self._new_requests:
+            if self.journal:
+                self.journal.clear()
+            for e in self._endpoints:
+                e.clear_requests()
+            self._ingest_order.clear()
+            self._unvalidated.clear()
+            self._event_index.clear()
+            self.aggregates.clear()
+            self.stored_requests = 0
+            self.stored_bytes = 0
+            self.evicted_requests = 0
+            self.evicted_bytes = 0
+        self._emit(('reset', None))
+
+    def _enforce_endpoint_retention(self, endp: GenericEndpoint):
+        policy = self.retention
+        while endp.requests_count() > 1 and policy.endpoint_exceeded(endp.requests_count(), endp.stored_bytes):
+            self._did_evict(endp.evict_oldest_request())
+
+    def _enforce_retention(self):
+        policy = self.retention
+        while self.stored_requests > 1:
+            endp, oldest = self._ingest_order[0]
+            if endp.request_with_id(oldest.id) is not oldest:
+                self._ingest_order.popleft()  # already evicted by its endpoint's limits
+                continue
+            if not policy.exceeded(self.stored_requests, self.stored_bytes, oldest_date=oldest.date):
+                break
+            # Requests are recorded in ID order, so the oldest request overall is also the oldest of its endpoint
+            self._ingest_order.popleft()
+            self._did_evict(endp.evict_oldest_request())
+        if len(self._ingest_order) > 2 * self.stored_requests + 100:
+            # Drop entries of requests evicted by their endpoint's limits (amortized, so recording stays O(1))
+            self._ingest_order = deque((e, r) for e, r in self._ingest_order if e.request_with_id(r.id) is r)
+
+    def _did_evict(self, request: GenericRequest):
+        self._event_index.remove(request)
+        self.aggregates.subtract(request.counts)
+        self.stored_requests -= 1
+        self.stored_bytes -= request.stored_size
+        self.evicted_requests += 1
+        self.evicted_bytes += request.size
+
+    def start(self):
+        threading.Thread(target=self._count_validation_forever, name='validation-counter', daemon=True).start()
+
+    def _count_validation_forever(self):
+        while True:
+            with self._new_requests:
+                self._new_requests.wait_for(lambda: self._unvalidated)
+            self.count_validation()
+
+    def count_validation(self):
+        with self._new_requests:
+            pending, self._unvalidated = self._unvalidated, deque()
+        for endp, request in pending:
+            if endp.request_with_id(request.id) is not request:
+                continue  # evicted
+            if (counts := validation_counts_or_none(request)) is None:  # computed without the lock, as it validates
+                continue
+            with self._new_requests:
+                if endp.request_with_id(request.id) is request and not is_validation_counted(request.counts):
+                    request.counts.update(counts)  # so they are subtracted when the request is evicted
+                    endp.aggregates.add(counts)
+                    self.aggregates.add(counts)
+
+    def query_events(self, query: EventQuery) -> (int, [(GenericRequest, int)]):
+        return self._event_index.query(query)
+
+    def wait_for_requests(self, after_id: int, timeout: float) -> bool:
+        """
+        Blocks until a request with ID greater than `after_id` is recorded or `timeout` (in seconds) expires.
+        Returns `False` on timeout.
+        """
+        with self._new_requests:
+            return self._new_requests.wait_for(lambda: self._last_request_id > after_id, timeout=timeout)
+
+
+schema_classes = [RAWSchema, RUMSchema, SRSchema, LogsSchema]
+
+
+def schemas_for_request(method: str, path: str, body: RequestBody) -> [Schema]:
+    schemas = []
+    for schema_class in [c for c in schema_classes if c.matches(method, path)]:
+        try:
+            schemas.append(schema_class(body=body))
+        except schema_class.parse_errors as error:
+            print(f'⚠️ Could not parse {method} {path} payload as {schema_class.pretty_name}: {error}')
+    return schemas
 
-def write_to_file(endpoint: GenericEndpoint):
-    no = len(endpoint.requests)
-    if 'rum' in endpoint.path:
-        pass
-        with open(f'fixtures/rum/{no}', 'wb') as f:
-            f.write(request.get_data())
-    elif 'replay' in endpoint.path:
-        with open(f'fixtures/replay/{no}', 'wb') as f:
-            f.write(request.get_data())
 
+endpoints: RequestStore = EndpointRegistry()
+request_stream = RequestStream()
+endpoints.on_event = request_stream.publish
+endpoints.has_listeners = request_stream.has_subscribers
 
 @app.route('/<path:rest>', methods=['POST'])
 def generic_post(rest):
@@ -142,42 +572,234 @@ def generic_post(rest):
     """
     global endpoints
 
-    gr = GenericRequest(r=request)
+    received_requests.inc(request.method, request.path)
+    received_bytes.inc(request.method, request.path, value=request.content_length or 0)
 
-    if existing := next((e for e in endpoints if e.hash() == gr.endpoint_hash()), None):
-        existing.requests.append(gr)
-        # write_to_file(endpoint=existing)
-        return f'OK - request recorded to known endpoint\n', 202
-    else:
-        endpoints.append(
-            GenericEndpoint(
-                method=gr.method,
-                path=gr.path,
-                requests=[gr],
-                schemas=gr.schemas
-            )
-        )
-        # write_to_file(endpoint=endpoints[len(endpoints)-1])5
+    if ingest_queue:
+        ingest_queue.submit(GenericRequest.capture(r=request))
+        return f'OK - request queued\n', 202
+
+    gr = GenericRequest.from_request(r=request)
+
+    is_new_endpoint = endpoints.record(request=gr)
+    if is_new_endpoint:
         return f'OK - request recorded to new endpoint\n', 202
+    else:
+        return f'OK - request recorded to known endpoint\n', 202
+
+def ingest(captured_request: dict):
+    """
+    Processes an upload accepted by `generic_post` in async ingest mode (on `ingest_queue` workers).
+    """
+    global endpoints
+
+    gr = GenericRequest(**captured_request)
+    gr.summary(validate=True)  # decodes, parses and validates payload, so readers find results ready
+    gr.counts.update(validation_counts(request=gr))  # already validated, so counted when recorded
+    endpoints.record(request=gr)
+
+ingest_queue: Optional[IngestQueue] = None  # set in async ingest mode
+
+requests_per_page = 50  # in endpoint pages of the inspector
+max_items_limit = 1000  # upper bound of `?limit=` in `/inspect_api`
+
+rendered_views = {'inspect', 'inspect_endpoint', 'inspect_request', 'inspect_json'}  # timed in `render_seconds`
+
+metrics.collected('mock_server_stored_requests', 'Requests currently stored, by endpoint', type='gauge',
+                  labels=('method', 'path'),
+                  collect=lambda: {(e.method, e.path): e.requests_count() for e in endpoints})
+metrics.collected('mock_server_stored_bytes', 'Bytes of requests currently stored (as sent), by endpoint',
+                  type='gauge', labels=('method', 'path'),
+                  collect=lambda: {(e.method, e.path): e.bytes_received() for e in endpoints})
+metrics.collected('mock_server_evicted_requests_total', 'Requests dropped by retention policy', type='counter',
+                  labels=(), collect=lambda: {(): endpoints.evicted_requests})
+metrics.collected('mock_server_evicted_bytes_total', 'Bytes of requests dropped by retention policy',
+                  type='counter', labels=(), collect=lambda: {(): endpoints.evicted_bytes})
+metrics.collected('mock_server_ingest_pending', 'Uploads waiting to be processed (with `--async-ingest`)',
+                  type='gauge', labels=(), collect=lambda: {(): ingest_queue.pending} if ingest_queue else {})
+
+max_wait = 60  # seconds, upper bound of `?wait=` in `/inspect_requests` and `/ingest_status`
+
+
+def parse_wait(args: dict) -> float:
+    """
+    Value of `?wait=<seconds>` (`0` if not set), up to `max_wait`. Raises `ValueError` if it is not
+    a finite, non-negative number (e.g. `nan`, which would never time out).
+    """
+    value = args.get('wait', '0')
+    try:
+        wait = float(value)
+    except ValueError:
+        wait = math.nan
+    if not math.isfinite(wait) or wait < 0:
+        raise ValueError(f'Invalid `wait`: {value} (expected a non-negative number of seconds)')
+    return min(wait, max_wait)
 
 @app.route('/inspect_requests/')
 def inspect_json():
     """
     GET /inspect_requests
 
-    Browse recorded requests serialized as JSON
+    Browse recorded requests serialized as JSON. Requests can be filtered and projected
+    with query parameters (see `RequestFilter`).
+
+    The `X-Mock-Server-Cursor` response header holds the ID of the last request considered
+    in this response: pass it as `?since=<cursor>` to only get newer requests next time.
+    With `?wait=<seconds>`, the response is held until matching requests arrive or the timeout expires.
     """
     global endpoints
-    endpoint_requests = [ { "endpoint": e.path, "requests": e.requests } for e in endpoints ]
-    # Remove non-raw schemas
-    for endpoint_request in endpoint_requests:
-        for request in endpoint_request["requests"]:
-            request.schemas = [s for s in request.schemas if isinstance(s, RAWSchema)]
 
-    resp = flask.Response(json.dumps(endpoint_requests, cls=DataClassJsonEncoder))
+    try:
+        request_filter = RequestFilter(args=request.args)
+        wait = parse_wait(args=request.args)
+    except ValueError as error:
+        return f'{error}\n', 400
+
+    if ingest_queue:
+        ingest_queue.wait_until_processed(timeout=max_wait)  # include uploads accepted before this call
+    endpoints.enforce_retention()
+    deadline = time.monotonic() + wait
+    while True:
+        cursor = endpoints.last_request_id
+        endpoint_requests = collect_requests(request_filter=request_filter, until_id=cursor)
+        remaining = deadline - time.monotonic()
+        # Without filters, all endpoints are listed, even with no requests: wait for actual requests
+        if any(requests for _, requests in endpoint_requests) or remaining <= 0:
+            break
+        endpoints.wait_for_requests(after_id=cursor, timeout=remaining)
+    g.render_start = time.perf_counter()  # time spent waiting for requests is not rendering
+
+    def generate():
+        # Stream the response, using the pre-serialized JSON of each request unless a projection is requested
+        yield '['
+        for i, (endp, requests) in enumerate(endpoint_requests):
+            yield f'{", " if i > 0 else ""}{{"endpoint": {json.dumps(endp.path)}, ' \
+                  f'"evicted_requests": {endp.evicted_requests}, "requests": ['
+            for j, r in enumerate(requests):
+                if j > 0:
+                    yield ', '
+                if request_filter.fields is None:
+                    yield r.json_fragment()
+                else:
+                    yield json.dumps(request_filter.project(r))
+            yield ']}'
+        yield ']'
+
+    resp = flask.Response(generate())
     resp.headers['Content-Type'] = 'application/json'
+    resp.headers['X-Mock-Server-Cursor'] = str(cursor)
+    resp.headers['X-Mock-Server-Evicted'] = str(endpoints.evicted_requests)
     return resp
 
+
+def collect_requests(request_filter: RequestFilter, until_id: int) -> [(GenericEndpoint, [GenericRequest])]:
+    """
+    Returns recorded requests with ID up to `until_id` that match `request_filter`, as `(endpoint, requests)`.
+    """
+    global endpoints
+
+    if not request_filter.is_active():
+        return [(e, e.requests_in_range(after_id=0, until_id=until_id)) for e in endpoints]
+
+    endpoint_requests = []
+    for e in endpoints:
+        if not request_filter.matches_endpoint(method=e.method, path=e.path):
+            continue
+        candidates = e.requests_in_range(after_id=request_filter.since or 0, until_id=until_id)
+        requests = [r for r in candidates if request_filter.matches_request(r)]
+        if requests:
+            endpoint_requests.append((e, requests))
+    return endpoint_requests
+
+keepalive_interval = 15  # seconds between keep-alive comments in `/inspect_stream`
+
+@app.route('/inspect_stream/')
+def inspect_stream():
+    """
+    GET /inspect_stream
+
+    Live `text/event-stream` of newly recorded requests: one `request` event with a compact summary
+    for each request, `reset` after `/reset` and `dropped` if this client was too slow to get some events.
+    Accepts the same filters as `/inspect_requests` (`since` and `fields` are ignored) and `?validate=0`
+    to leave out validation verdicts.
+    """
+    try:
+        request_filter = RequestFilter(args=request.args)
+    except ValueError as error:
+        return f'{error}\n', 400
+    validate = request.args.get('validate', '1') != '0'
+    subscription = request_stream.subscribe()
+
+    def events():
+        try:
+            yield ': connected\n\n'
+            while True:
+                item = subscription.next(timeout=keepalive_interval)
+                if dropped := subscription.take_dropped():
+                    yield server_sent_event('dropped', {'count': dropped})
+                if item is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                kind, gr = item
+                if kind == 'reset':
+                    yield server_sent_event('reset', {})
+                elif request_filter.matches_endpoint(method=gr.method, path=gr.path) \
+                        and (gr := gr.load()) is not None and request_filter.matches_request(gr):
+                    summary = gr.summary(validate=validate)
+                    summary['counters'] = endpoint_counters(method=gr.method, path=gr.path)
+                    yield server_sent_event('request', summary, id=gr.id)
+        finally:
+            request_stream.unsubscribe(subscription)
+
+    resp = flask.Response(events(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+def endpoint_counters(method: str, path: str) -> dict:
+    """
+    Current counters of the endpoint and of all endpoints, sent with each `/inspect_stream` event, so live
+    views show the effect of evictions without reloading.
+    """
+    global endpoints
+
+    endp = endpoints.endpoint(method=method, path=path)
+    return {
+        "requests_count": endp.requests_count() if endp else 0,
+        "bytes_received": endp.bytes_received() if endp else 0,
+        "evicted_requests": endp.evicted_requests if endp else 0,
+        "evicted_bytes": endp.evicted_bytes if endp else 0,
+        "total_evicted_requests": endpoints.evicted_requests,
+        "total_evicted_bytes": endpoints.evicted_bytes,
+    }
+
+@app.route('/stats')
+def stats():
+    """
+    GET /stats
+
+    Running aggregates of stored requests, on all endpoints and by endpoint, as JSON: requests, bytes (as sent
+    and decompressed), RUM events by type, Session Replay records by type, logs by status and validation results.
+    Aggregates are updated when requests are recorded and evicted, so this costs the same whatever is stored.
+    Validation results are counted in the background after requests are recorded, so they may lag behind.
+    """
+    global endpoints
+    endpoints.enforce_retention()
+    return {
+        **endpoints.aggregates.as_json(),
+        "evicted_requests": endpoints.evicted_requests,
+        "evicted_bytes": endpoints.evicted_bytes,
+        "endpoints": [
+            {
+                "method": e.method,
+                "path": e.path,
+                **e.aggregates.as_json(),
+                "evicted_requests": e.evicted_requests,
+                "evicted_bytes": e.evicted_bytes,
+            }
+            for e in endpoints
+        ],
+    }
+
 @app.route('/inspect/')
 def inspect():
     """
@@ -186,6 +808,7 @@ def inspect():
     Browse recorded requests.
     """
     global endpoints
+    endpoints.enforce_retention()
     return render_template('endpoints.html', title='Endpoints', endpoints=endpoints)
 
 @app.route('/reset')
@@ -196,22 +819,80 @@ def reset():
     Clear currently logged requests on all endpoints
     """
     global endpoints
-    for e in endpoints:
-        e.requests.clear()
+    if ingest_queue:
+        ingest_queue.wait_until_processed(timeout=max_wait)  # clear uploads accepted before this call too
+    endpoints.clear()
     return 'OK', 200
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    GET /metrics
+
+    Metrics about the mock server itself, in Prometheus text format.
+    """
+    return metrics.exposition(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.before_request
+def start_render_timer():
+    if request.endpoint in rendered_views:
+        g.render_start = time.perf_counter()
+
+@app.after_request
+def stop_render_timer(response):
+    if (start := g.get('render_start')) is None:
+        return response
+    view = request.endpoint
+    if not response.is_streamed:
+        render_seconds.observe(time.perf_counter() - start, view)
+        return response
+
+    body = response.response
+
+    def timed_body():
+        # Streamed responses (e.g. `/inspect_requests`) are rendered while they are sent
+        try:
+            yield from body
+        finally:
+            render_seconds.observe(time.perf_counter() - start, view)
+
+    response.response = timed_body()
+    return response
+
+@app.route('/ingest_status')
+def ingest_status():
+    """
+    GET /ingest_status
+
+    Progress of async ingest (see `--async-ingest`), as JSON. With `?wait=<seconds>`, the response is held
+    until all uploads accepted so far are processed or the timeout expires.
+    """
+    if not ingest_queue:
+        return {"async_ingest": False}
+    try:
+        wait = parse_wait(args=request.args)
+    except ValueError as error:
+        return f'{error}\n', 400
+    caught_up = ingest_queue.wait_until_processed(timeout=wait)
+    return {"async_ingest": True, "caught_up": caught_up} | ingest_queue.stats()
+
 
 
 @app.route('/inspect/<schema_name>/<endpoint_hash>')
 def inspect_endpoint(schema_name, endpoint_hash):
     global endpoints
+    endpoints.enforce_retention()
 
-    if endp := next((e for e in endpoints if e.hash() == endpoint_hash), None):
+    if endp := endpoints.endpoint_with_hash(hash=endpoint_hash):
         if schm := endp.schema_with_name(name=schema_name):
+            pagination = Pagination(page=request.args.get('page', 1, type=int), per_page=requests_per_page,
+                                    total=endp.requests_count())
             return render_template(
                 'endpoint.html',
                 back_url=url_for('inspect'),
                 endpoint=endp,
+                requests=endp.requests_page(offset=pagination.offset, limit=pagination.per_page),
+                pagination=pagination,
                 selected_schema=schm
             )
         else:
@@ -222,40 +903,159 @@ def inspect_endpoint(schema_name, endpoint_hash):
         return redirect(url_for('inspect'))
 
 
-@app.route('/inspect/<schema_name>/<endpoint_hash>/<request_hash>')
-def inspect_request(schema_name, endpoint_hash, request_hash):
+@app.route('/inspect/<schema_name>/<endpoint_hash>/<int:request_id>')
+def inspect_request(schema_name, endpoint_hash, request_id):
     global endpoints
+    endpoints.enforce_retention()
 
-    if endp := next((e for e in endpoints if e.hash() == endpoint_hash), None):
-        if req := next((r for r in endp.requests if r.hash() == request_hash), None):
+    if endp := endpoints.endpoint_with_hash(hash=endpoint_hash):
+        if req := endp.request_with_id(id=request_id):
             if schm := req.schema_with_name(name=schema_name):
+                page = request.args.get('page', 1, type=int)  # read before `request` is shadowed in template
                 return render_template(
                     'request.html',
                     back_url=url_for('inspect'),
                     endpoint=endp,
                     request=req,
+                    page=page,
                     selected_schema=schm
                 )
             else:
-                print(f'⚠️ Could not find request with hash {request_hash}')
+                print(f'⚠️ Request has no schema named {schema_name}')
                 return redirect(url_for('inspect'))
         else:
-            print(f'⚠️ Endpoint has no schema named {schema_name}')
+            print(f'⚠️ Could not find request with ID {request_id}')
             return redirect(url_for('inspect'))
     else:
         print(f'⚠️ Could not find endpoint with hash {endpoint_hash}')
         return redirect(url_for('inspect'))
 
-def run(prefer_localhost: bool):
+@app.route('/inspect_api/<schema_name>/<endpoint_hash>/<int:request_id>/<items_name>')
+def inspect_items(schema_name, endpoint_hash, request_id, items_name):
+    """
+    GET /inspect_api/<schema_name>/<endpoint_hash>/<request_id>/<items_name>
+
+    Items of a recorded request (`events` for RUM, `records` and `segment` for Session Replay, `logs` for Logs)
+    with their validation result, as JSON. Used by inspector pages to load item bodies on demand.
+    Accepts `?offset=` and `?limit=` (up to 1000).
+    """
+    global endpoints
+
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(0, request.args.get('limit', 100, type=int)), max_items_limit)
+    if not (endp := endpoints.endpoint_with_hash(hash=endpoint_hash)):
+        return f'Could not find endpoint with hash {endpoint_hash}\n', 404
+    if not (req := endp.request_with_id(id=request_id)):
+        return f'Could not find request with ID {request_id}\n', 404
+    if not (schm := req.schema_with_name(name=schema_name)):
+        return f'Request has no schema named {schema_name}\n', 404
+    if (result := schm.items(name=items_name, offset=offset, limit=limit)) is None:
+        return f'Schema {schema_name} has no items named {items_name}\n', 404
+    total, items = result
+    return {"total": total, "offset": offset, "items": items}
+
+@app.route('/query')
+def query_events():
+    """
+    GET /query
+
+    RUM events of stored requests matching query parameters (see `EventQuery`), as JSON. Events are found
+    with indexes built when requests are recorded, so only matching events are visited.
+    """
+    global endpoints
+
+    try:
+        query = EventQuery(args=request.args)
+    except ValueError as error:
+        return f'{error}\n', 400
+
+    if ingest_queue:
+        ingest_queue.wait_until_processed(timeout=max_wait)  # include uploads accepted before this call
+    endpoints.enforce_retention()
+    total, matches = endpoints.query_events(query=query)
+    return {
+        "total": total,
+        "offset": query.offset,
+        "events": [
+            {"request_id": req.id, "path": req.path, "index": index, "event": req.body.ndjson_events[index]}
+            for req, index in matches
+        ],
+    }
+
+def open_journal(directory: str, segment_size: int):
+    """
+    Restores requests recorded in the journal stored in `directory`, then records new requests to it.
+    """
+    global endpoints
+
+    journal = Journal(directory=directory, segment_size=segment_size)
+    restored = 0
+    for entry in journal.entries():
+        endpoints.restore(request=GenericRequest.from_journal(entry=entry))
+        restored += 1
+    endpoints.journal = journal
+    atexit.register(journal.flush)
+    print(f'Restored {restored} requests from journal in {directory}')
+
+def run(prefer_localhost: bool, debug: bool, threads: int, processes: int):
     address = get_localhost() if prefer_localhost is True else get_best_server_address()
-    app.run(debug=True, host=address.ip)
+    if debug:
+        endpoints.start()
+        app.run(debug=True, host=address.ip)
+    else:
+        serve(app=app, host=address.ip, port=5000, threads=threads, processes=processes, on_start=endpoints.start)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--prefer-localhost", action='store_true')
     parser.add_argument("--update-schemas", action='store_true')
+    parser.add_argument("--debug", action='store_true',
+                        help="Run Flask's development server, with reloader and debugger, instead of the threaded server")
+    parser.add_argument("--threads", type=int, default=32,
+                        help="Number of worker threads handling requests (ignored with --debug)")
+    parser.add_argument("--validation-workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of processes validating large batches of events (0 to validate in-process)")
+    parser.add_argument("--validation-batch-size", type=int, default=200,
+                        help="Minimum number of events in a batch for it to be validated in the process pool")
+    parser.add_argument("--views-cache-size", type=int, default=256,
+                        help="Memory budget (in MB) for validation results and pretty-printed JSON kept between renders")
+    parser.add_argument("--compact-storage", action='store_true',
+                        help="Keep only original bytes of recorded requests and decode them on demand")
+    parser.add_argument("--decoded-cache-size", type=int, default=32,
+                        help="Memory budget (in MB) for decoded request bodies, in compact storage mode")
+    parser.add_argument("--sqlite", metavar='PATH',
+                        help="Store requests in this SQLite database instead of memory")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Number of server processes sharing the port (requires --sqlite)")
+    parser.add_argument("--async-ingest", action='store_true',
+                        help="Acknowledge uploads right away and decode, parse and validate them in the background")
+    parser.add_argument("--ingest-workers", type=int, default=2,
+                        help="Number of threads processing uploads, with --async-ingest")
+    parser.add_argument("--ingest-queue-size", type=int, default=1000,
+                        help="Maximum number of uploads waiting to be processed, with --async-ingest "
+                             "(uploads block when it is full)")
+    parser.add_argument("--journal", metavar='DIR',
+                        help="Record requests to a journal in this directory and restore them on start "
+                             "(implies --compact-storage)")
+    parser.add_argument("--journal-segment-size", type=int, default=64,
+                        help="Size (in MB) of journal segment files")
+    parser.add_argument("--max-requests", type=int,
+                        help="Maximum number of requests kept, on all endpoints (oldest are evicted first)")
+    parser.add_argument("--max-stored-mb", type=float,
+                        help="Maximum size (in MB) of requests kept, on all endpoints: bodies as received, "
+                             "plus their decoded and parsed views when kept in memory (oldest are evicted first)")
+    parser.add_argument("--max-age", type=float,
+                        help="Maximum age (in seconds) of requests kept")
+    parser.add_argument("--max-requests-per-endpoint", type=int,
+                        help="Maximum number of requests kept for each endpoint")
+    parser.add_argument("--max-stored-mb-per-endpoint", type=float,
+                        help="Maximum size (in MB) of requests kept for each endpoint (see --max-stored-mb)")
 
     args = parser.parse_args()
+    if args.processes > 1 and not args.sqlite:
+        parser.error('--processes requires --sqlite, as other storages are not shared between processes')
+    if args.sqlite and args.journal:
+        parser.error('--journal cannot be used with --sqlite, which is already persistent')
     if args.update_schemas:
         update_schemas()
         exit()
@@ -264,4 +1064,25 @@ if __name__ == '__main__':
         print('Missing .schemas. Please run app.py --update-schemas')
         exit()
 
-    run(args.prefer_localhost)
+    configure_validation_pool(workers=args.validation_workers, min_batch_size=args.validation_batch_size)
+    configure_derived_views(max_bytes=args.views_cache_size * 1024 * 1024)
+    configure_compact_storage(enabled=args.compact_storage or args.journal is not None,
+                              max_bytes=args.decoded_cache_size * 1024 * 1024)
+    if args.async_ingest:
+        ingest_queue = IngestQueue(process=ingest, workers=args.ingest_workers, max_pending=args.ingest_queue_size)
+    if args.sqlite:
+        endpoints = SQLiteRequestStore(path=args.sqlite, make_request=GenericRequest.from_metadata,
+                                       schema_classes=schema_classes)
+        endpoints.on_event = request_stream.publish
+        endpoints.has_listeners = request_stream.has_subscribers
+    endpoints.retention = RetentionPolicy(
+        max_requests=args.max_requests,
+        max_bytes=int(args.max_stored_mb * 1024 * 1024) if args.max_stored_mb is not None else None,
+        max_age=args.max_age,
+        max_requests_per_endpoint=args.max_requests_per_endpoint,
+        max_bytes_per_endpoint=int(args.max_stored_mb_per_endpoint * 1024 * 1024)
+        if args.max_stored_mb_per_endpoint is not None else None,
+    )
+    if args.journal and (not args.debug or is_running_from_reloader()):  # only in the process serving requests
+        open_journal(directory=args.journal, segment_size=args.journal_segment_size * 1024 * 1024)
+    run(prefer_localhost=args.prefer_localhost, debug=args.debug, threads=args.threads, processes=args.processes)
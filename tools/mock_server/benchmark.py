@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import argparse
+import datetime
+import gzip
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import threading
+import time
+import uuid
+import zlib
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+from replay import ReplayReport
+from request_store import endpoint_hash
+
+
+class Payload:
+    """
+    One upload sent by a benchmark scenario: path (with query string), headers and body (already compressed).
+    """
+    path: str
+    headers: dict
+    body: bytes
+
+    def __init__(self, path: str, headers: dict, body: bytes):
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+def rum_payload(rng: random.Random, events: int) -> Payload:
+    """
+    Gzipped NDJSON batch of `events` RUM events from one session, as uploaded by the SDKs.
+    """
+    session_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    view_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    date = 1700000000000 + rng.randrange(10 ** 9)
+    lines = []
+    for i in range(events):
+        event_type = rng.choice(['view', 'action', 'resource', 'error', 'long_task'])
+        lines.append(json.dumps({
+            "type": event_type,
+            "date": date + i * 100,
+            "application": {"id": "00000000-0000-0000-0000-000000000001"},
+            "session": {"id": session_id, "type": "user"},
+            "view": {"id": view_id, "url": f"Scene{rng.randrange(5)}", "name": f"Scene{rng.randrange(5)}"},
+            "source": "unity",
+            "service": "benchmark",
+            "_dd": {"format_version": 2},
+        }))
+    return Payload(
+        path='/api/v2/rum?ddsource=unity&ddtags=service:benchmark',
+        headers={'Content-Type': 'text/plain;charset=UTF-8', 'Content-Encoding': 'gzip'},
+        body=gzip.compress('\n'.join(lines).encode('utf-8'))
+    )
+
+
+def session_replay_payload(rng: random.Random, records: int) -> Payload:
+    """
+    Multipart upload of one Session Replay segment with `records` records, compressed with deflate (zlib).
+    """
+    timestamp = 1700000000000 + rng.randrange(10 ** 9)
+    segment = {
+        "application": {"id": "00000000-0000-0000-0000-000000000001"},
+        "session": {"id": str(uuid.UUID(int=rng.getrandbits(128)))},
+        "view": {"id": str(uuid.UUID(int=rng.getrandbits(128)))},
+        "start": timestamp,
+        "end": timestamp + records * 50,
+        "records_count": records,
+        "source": "android",
+        "records": [{"type": rng.choice([4, 10, 11]), "timestamp": timestamp + i * 50} for i in range(records)],
+    }
+    segment_bytes = zlib.compress(json.dumps(segment).encode('utf-8'))
+    metadata_bytes = json.dumps({"records_count": records, "raw_segment_size": len(segment_bytes)}).encode('utf-8')
+    boundary = f'benchmark-{rng.getrandbits(64):016x}'
+    body = b''.join([
+        f'--{boundary}\r\nContent-Disposition: form-data; name="segment"; filename="blob"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'), segment_bytes,
+        f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="event"; filename="blob"\r\n'
+        f'Content-Type: application/json\r\n\r\n'.encode('utf-8'), metadata_bytes,
+        f'\r\n--{boundary}--\r\n'.encode('utf-8'),
+    ])
+    return Payload(
+        path='/api/v2/replay?ddsource=unity',
+        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        body=body
+    )
+
+
+def logs_payload(rng: random.Random, logs: int) -> Payload:
+    """
+    Uncompressed JSON array of `logs` log events.
+    """
+    date = 1700000000000 + rng.randrange(10 ** 9)
+    events = [{
+        "status": rng.choice(['debug', 'info', 'warn', 'error']),
+        "service": "benchmark",
+        "message": f"Log message {i} " + 'x' * rng.randrange(20, 200),
+        "date": date + i,
+        "ddtags": "env:benchmark",
+    } for i in range(logs)]
+    return Payload(
+        path='/api/v2/logs?ddsource=unity',
+        headers={'Content-Type': 'application/json'},
+        body=json.dumps(events).encode('utf-8')
+    )
+
+
+# Scenarios by name, each making the payload of one upload:
+scenarios: dict[str, Callable[[random.Random], Payload]] = {
+    'rum-small-gzip': lambda rng: rum_payload(rng=rng, events=10),
+    'rum-large-gzip': lambda rng: rum_payload(rng=rng, events=1000),
+    'session-replay-deflate': lambda rng: session_replay_payload(rng=rng, records=200),
+    'logs-plain': lambda rng: logs_payload(rng=rng, logs=50),
+}
+
+# Inspector pages of each scenario's endpoint: schema name used in `/inspect/<schema_name>/...`
+inspector_schemas = {'/api/v2/rum': 'rum', '/api/v2/replay': 'session-replay', '/api/v2/logs': 'raw'}
+
+
+class InProcessClient:
+    """
+    Sends requests to the mock server app loaded in this process, through Flask's test client.
+    """
+    def __init__(self):
+        import app as mock_server
+        from validation.validation import configure_validation_pool
+        configure_validation_pool(workers=0, min_batch_size=0)  # so all CPU time is spent (and measured) here
+        self._app = mock_server.app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[dict] = None) -> (int, bytes):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self._app.test_client()
+        response = self._local.client.open(path, method=method, data=body, headers=headers)
+        return response.status_code, response.get_data()
+
+    def cpu_time(self) -> Optional[float]:
+        return time.process_time()
+
+    def rss(self) -> Optional[int]:
+        return process_rss(pid=os.getpid())
+
+
+class HTTPClient:
+    """
+    Sends requests to a running mock server. CPU time and RSS are only measured if `pid` is known.
+    """
+    def __init__(self, target: str, pid: Optional[int]):
+        url = urlsplit(target)
+        self._netloc = url.netloc
+        self._connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self._base_path = url.path.rstrip('/')
+        self._pid = pid
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[dict] = None) -> (int, bytes):
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = self._connection_class(self._netloc)
+        connection = self._local.connection
+        try:
+            connection.request(method, self._base_path + path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            del self._local.connection
+            return 0, b''
+
+    def cpu_time(self) -> Optional[float]:
+        if self._pid is None:
+            return None
+        try:
+            with open(f'/proc/{self._pid}/stat') as file:
+                fields = file.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')  # utime + stime
+        except OSError:
+            return None
+
+    def rss(self) -> Optional[int]:
+        return process_rss(pid=self._pid) if self._pid is not None else None
+
+
+def process_rss(pid: int) -> Optional[int]:
+    """
+    Resident set size of process `pid` in bytes, or `None` if it can't be read (outside of Linux).
+    """
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def send(client, payloads: [Payload], concurrency: int) -> ReplayReport:
+    """
+    Uploads `payloads` as fast as possible over `concurrency` connections.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    next_index = iter(range(len(payloads)))
+
+    def send_payloads():
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                return
+            payload = payloads[index]
+            start = time.monotonic()
+            status, _ = client.request('POST', payload.path, body=payload.body, headers=payload.headers)
+            latency = time.monotonic() - start
+            with lock:
+                latencies.append(latency)
+                errors[0] += 0 if 200 <= status < 300 else 1
+
+    start = time.monotonic()
+    workers = [threading.Thread(target=send_payloads, daemon=True) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return ReplayReport(requests=len(latencies), errors=errors[0], duration=time.monotonic() - start,
+                        latencies=latencies)
+
+
+def wait_for_ingest(client) -> float:
+    """
+    Waits until uploads are processed, if the server runs with `--async-ingest`. Returns the time waited (seconds).
+    """
+    start = time.monotonic()
+    client.request('GET', '/ingest_status?wait=60')
+    return time.monotonic() - start
+
+
+def run_scenario(client, name: str, requests: int, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    payloads = [scenarios[name](rng) for _ in range(requests)]
+    client.request('GET', '/reset')
+
+    cpu_before, rss_before = client.cpu_time(), client.rss()
+    report = send(client=client, payloads=payloads, concurrency=concurrency)
+    drain = wait_for_ingest(client=client)
+    cpu_after, rss_after = client.cpu_time(), client.rss()
+
+    result = report.as_json()
+    result["payload_bytes"] = sum(len(p.body) for p in payloads) // len(payloads)
+    result["ingest_drain_s"] = drain
+    result["cpu_ms_per_request"] = (cpu_after - cpu_before) * 1000 / requests if cpu_before is not None else None
+    result["rss_growth_mb"] = (rss_after - rss_before) / (1024 * 1024) if rss_before is not None else None
+    return result
+
+
+def time_get(client, path: str, repeats: int) -> Optional[float]:
+    """
+    Median time (in milliseconds) to get `path`, or `None` if it fails.
+    """
+    durations = []
+    for _ in range(repeats):
+        start = time.monotonic()
+        status, _ = client.request('GET', path)
+        if status != 200:
+            return None
+        durations.append((time.monotonic() - start) * 1000)
+    return statistics.median(durations)
+
+
+def measure_rendering(client, volumes: [int], concurrency: int, repeats: int, seed: int) -> [dict]:
+    """
+    Fills the server with a mix of all scenarios up to each of `volumes` (number of stored requests) and measures
+    how long `/inspect_requests/` and inspector pages take to render at that volume.
+    """
+    rng = random.Random(seed)
+    mix = ['rum-small-gzip'] * 6 + ['session-replay-deflate'] * 2 + ['logs-plain'] * 2 + ['rum-large-gzip']
+    client.request('GET', '/reset')
+    stored = 0
+    stored_bytes = 0
+    rss_start = client.rss()
+    results = []
+    for volume in sorted(volumes):
+        payloads = [scenarios[mix[i % len(mix)]](rng) for i in range(stored, volume)]
+        send(client=client, payloads=payloads, concurrency=concurrency)
+        wait_for_ingest(client=client)
+        stored = volume
+        stored_bytes += sum(len(p.body) for p in payloads)
+
+        pages = {}
+        for path, schema_name in inspector_schemas.items():
+            hash = endpoint_hash(method='POST', path=path)
+            pages[f'endpoint {path}'] = time_get(client, f'/inspect/{schema_name}/{hash}', repeats)
+            status, data = client.request('GET', f'/inspect_requests/?path={path}&fields=id')
+            if status == 200 and (endpoints := json.loads(data)) and endpoints[0]['requests']:
+                request_id = endpoints[0]['requests'][-1]['id']
+                pages[f'request {path}'] = time_get(client, f'/inspect/{schema_name}/{hash}/{request_id}', repeats)
+        rss = client.rss()
+        results.append({
+            "stored_requests": volume,
+            "stored_mb": stored_bytes / (1024 * 1024),
+            "rss_growth_mb": (rss - rss_start) / (1024 * 1024) if rss_start is not None else None,
+            "inspect_requests_ms": time_get(client, '/inspect_requests/', repeats),
+            "inspect_ms": time_get(client, '/inspect/', repeats),
+            "inspector_pages_ms": pages,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks ingest and rendering of the mock server. "
+                                                 "Results are printed as JSON.")
+    parser.add_argument("--target", help="Base URL of a running mock server (by default, the app is benchmarked "
+                                         "in this process, with validation in-process)")
+    parser.add_argument("--server-pid", type=int,
+                        help="With --target, PID of the server, to measure its CPU time and RSS (Linux only)")
+    parser.add_argument("--scenario", action='append', choices=list(scenarios),
+                        help="Scenario to run (can be repeated, defaults to all)")
+    parser.add_argument("--requests", type=int, default=500, help="Number of uploads sent in each scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of concurrent connections")
+    parser.add_argument("--volumes", default='100,1000,5000',
+                        help="Comma-separated numbers of stored requests at which rendering is measured "
+                             "(defaults to 100,1000,5000, empty to skip)")
+    parser.add_argument("--render-repeats", type=int, default=3,
+                        help="Number of times each page is rendered (the median time is reported)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of generated payloads")
+    parser.add_argument("--output", help="File results are written to (defaults to stdout)")
+
+    args = parser.parse_args()
+    if args.requests < 1 or args.concurrency < 1 or args.render_repeats < 1:
+        parser.error('--requests, --concurrency and --render-repeats must be at least 1')
+    try:
+        volumes = [int(v) for v in args.volumes.split(',') if v]
+    except ValueError:
+        parser.error('--volumes must be a comma-separated list of numbers')
+
+    client = HTTPClient(target=args.target, pid=args.server_pid) if args.target else InProcessClient()
+    results = {
+        "date": datetime.datetime.now().isoformat(),
+        "mode": "http" if args.target else "in-process",
+        "target": args.target,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": {"requests": args.requests, "concurrency": args.concurrency, "seed": args.seed},
+        "scenarios": {
+            name: run_scenario(client=client, name=name, requests=args.requests, concurrency=args.concurrency,
+                               seed=args.seed)
+            for name in (args.scenario or scenarios)
+        },
+        "rendering": measure_rendering(client=client, volumes=volumes, concurrency=args.concurrency,
+                                       repeats=args.render_repeats, seed=args.seed),
+    }
+    client.request('GET', '/reset')
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import bisect
+import datetime
+import sys
+import threading
+from typing import Optional
+from request_filter import event_attribute, event_attributes
+from schemas.rum import RUMSchema
+
+max_query_limit = 1000  # upper bound of `?limit=` in `/query`
+unknown_date = float('-inf')  # date of indexed events without a numeric `date`
+
+
+def indexed_events(request) -> [tuple]:
+    """
+    Index entries of RUM events sent in `request`, as `(index in request, date, attribute values)`, where
+    attribute values follow `event_attributes` order (as strings, like values they are compared to) and date is
+    the event's `date` (milliseconds since epoch, `None` if not a number). Empty for requests to other endpoints.
+    """
+    if not RUMSchema.matches(request.method, request.path):
+        return []
+    entries = []
+    for index, event in enumerate(request.body.ndjson_events):
+        date = event.get('date') if isinstance(event, dict) else None
+        entries.append((
+            index,
+            date if isinstance(date, (int, float)) and not isinstance(date, bool) else None,
+            tuple(f'{event_attribute(event, keys)}' for keys in event_attributes.values()),
+        ))
+    return entries
+
+
+class EventQuery:
+    """
+    Query of RUM events served by `/query`, configured with query parameters:
+    - `type`, `session.id`, `view.id`, `application.id`: only return events matching all of these;
+    - `from`, `to`: range of event `date` (`from` included, `to` excluded), in milliseconds since epoch or ISO 8601;
+    - `order`: `asc` (default) or `desc`, by event date (then in the order events were recorded);
+    - `offset`, `limit`: page of matching events to return (`limit` defaults to 100, up to 1000).
+    """
+    filters: dict  # attribute name (in `event_attributes`) -> expected value
+    date_from: Optional[float]  # in milliseconds since epoch
+    date_to: Optional[float]
+    descending: bool
+    offset: int
+    limit: int
+
+    def __init__(self, args: dict):
+        self.filters = {name: args[name] for name in event_attributes if args.get(name)}
+        self.date_from = EventQuery._parse_date(args, 'from')
+        self.date_to = EventQuery._parse_date(args, 'to')
+        if (order := args.get('order', 'asc')) not in ('asc', 'desc'):
+            raise ValueError(f'Invalid `order`: {order} (expected `asc` or `desc`)')
+        self.descending = order == 'desc'
+        self.offset = max(0, EventQuery._parse_int(args, 'offset', default=0))
+        self.limit = max(0, min(EventQuery._parse_int(args, 'limit', default=100), max_query_limit))
+
+    def matches(self, date: Optional[float], values: tuple) -> bool:
+        if self.date_from is not None and (date is None or date < self.date_from):
+            return False
+        if self.date_to is not None and (date is None or date >= self.date_to):
+            return False
+        return all(values[position] == self.filters[name]
+                   for position, name in enumerate(event_attributes) if name in self.filters)
+
+    @staticmethod
+    def _parse_int(args: dict, name: str, default: int) -> int:
+        try:
+            return int(args.get(name, default))
+        except ValueError:
+            raise ValueError(f'Invalid `{name}`: {args[name]} (expected an integer)')
+
+    @staticmethod
+    def _parse_date(args: dict, name: str) -> Optional[float]:
+        if not (value := args.get(name)):
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return datetime.datetime.fromisoformat(value).timestamp() * 1000
+        except ValueError:
+            raise ValueError(f'Invalid `{name}` date: {value} (expected milliseconds since epoch or ISO 8601 format)')
+
+
+class EventIndex:
+    """
+    Secondary indexes over RUM events of stored requests, updated when requests are recorded and evicted:
+    events by value of each of `event_attributes` and by date. Queries only visit events with the rarest
+    of the requested values (or in the requested date range), instead of parsing every stored request.
+
+    Evicted requests are forgotten at once, their index entries are skipped by queries and dropped
+    when they outnumber live ones (so eviction stays O(1), amortized).
+
+    Indexed events are plain tuples, `(date, request ID, index in request, attribute values)`, so they sort by date
+    (`-inf` if unknown), then in the order they were recorded. Attribute values and their tuples are shared between
+    events, as most events have the same values as many others (e.g. session and view IDs).
+    """
+    def __init__(self):
+        self._by_value = {name: {} for name in event_attributes}  # attribute -> value -> [event], as recorded
+        self._by_date = []  # [event], sorted
+        self._values = {}  # attribute values -> same attribute values, to share them between events
+        self._requests = {}  # request ID -> (request, number of indexed events), for stored requests
+        self._live_events = 0
+        self._dead_events = 0
+        self._lock = threading.Lock()
+
+    def add(self, request):
+        entries = indexed_events(request)
+        if not entries:
+            return
+        with self._lock:
+            self._requests[request.id] = (request, len(entries))
+            self._live_events += len(entries)
+            for index, date, values in entries:
+                if (shared := self._values.get(values)) is None:
+                    shared = self._values[values] = tuple(sys.intern(value) for value in values)
+                event = (unknown_date if date is None else date, request.id, index, shared)
+                values = shared
+                for name, value in zip(event_attributes, values):
+                    self._by_value[name].setdefault(value, []).append(event)
+                bisect.insort(self._by_date, event)  # events mostly arrive in date order
+
+    def remove(self, request):
+        with self._lock:
+            if (entry := self._requests.pop(request.id, None)) is None:
+                return
+            self._live_events -= entry[1]
+            self._dead_events += entry[1]
+            if self._dead_events > self._live_events + 1000:
+                self._compact()
+
+    def clear(self):
+        with self._lock:
+            self._by_value = {name: {} for name in event_attributes}
+            self._by_date = []
+            self._values = {}
+            self._requests = {}
+            self._live_events = 0
+            self._dead_events = 0
+
+    def query(self, query: EventQuery) -> (int, [tuple]):
+        """
+        Returns the number of events matching `query` and the requested page of them, as `(request, index)`.
+        """
+        with self._lock:
+            if query.filters:
+                candidates = min((self._by_value[name].get(value, []) for name, value in query.filters.items()),
+                                 key=len)
+            else:
+                candidates = self._by_date
+                if query.date_from is not None:
+                    start = bisect.bisect_left(candidates, (query.date_from,))
+                    candidates = candidates[start:]
+                if query.date_to is not None:
+                    end = bisect.bisect_left(candidates, (query.date_to,))
+                    candidates = candidates[:end]
+            requests = self._requests
+            matches = [e for e in candidates if e[1] in requests
+                       and query.matches(date=None if e[0] == unknown_date else e[0], values=e[3])]
+            if query.filters:
+                matches.sort()
+            if query.descending:
+                matches.reverse()
+            page = matches[query.offset:query.offset + query.limit]
+            return len(matches), [(requests[request_id][0], index) for _, request_id, index, _ in page]
+
+    def _compact(self):
+        live = self._requests
+        for values in self._by_value.values():
+            for value in list(values):
+                if events := [e for e in values[value] if e[1] in live]:
+                    values[value] = events
+                else:
+                    del values[value]
+        self._by_date = [e for e in self._by_date if e[1] in live]
+        self._values = {e[3]: e[3] for e in self._by_date}
+        self._dead_events = 0
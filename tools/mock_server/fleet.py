@@ -0,0 +1,448 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import argparse
+import datetime
+import gzip
+import heapq
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+import zlib
+from typing import Optional
+from urllib.parse import urlsplit
+from benchmark import Payload
+from replay import ReplayReport
+
+sdk_version = '1.0.0'
+application_id = '3a4f9e2c-6b7d-4e1a-9c8b-0f1e2d3c4b5a'
+scenes = ['MainMenu', 'Loading', 'Level1', 'Level2', 'Level3', 'Shop', 'Settings', 'Leaderboard']
+resource_hosts = ['https://api.example-game.com', 'https://cdn.example-game.com']
+devices = [  # (brand, model, OS name, OS version)
+    ('Google', 'Pixel 7', 'Android', '14'),
+    ('Samsung', 'SM-G991B', 'Android', '13'),
+    ('Xiaomi', 'Redmi Note 10', 'Android', '12'),
+    ('Apple', 'iPhone14,2', 'iOS', '17.1'),
+    ('Apple', 'iPad13,4', 'iPadOS', '16.6'),
+]
+
+
+class FleetOptions:
+    """
+    Shape of the traffic sent by each simulated device.
+    """
+    actions_per_batch: int  # average number of user actions between two uploads
+    logs_per_batch: int  # average number of logs between two uploads (`0` disables logs)
+    replay_sample_rate: float  # fraction of sessions recorded with Session Replay
+    views_per_session: int  # average
+    batch_interval: float  # seconds between two uploads of the same device (`0` to send as fast as possible)
+
+    def __init__(self, actions_per_batch: int, logs_per_batch: int, replay_sample_rate: float,
+                 views_per_session: int, batch_interval: float):
+        self.actions_per_batch = actions_per_batch
+        self.logs_per_batch = logs_per_batch
+        self.replay_sample_rate = replay_sample_rate
+        self.views_per_session = views_per_session
+        self.batch_interval = batch_interval
+
+
+class Device:
+    """
+    One simulated Unity app instance. Each call to `next_batch()` advances its own simulated clock by one batch
+    interval and returns the uploads (RUM, logs, Session Replay) of what happened meanwhile. Payloads only depend
+    on the seed and device index, not on when they are sent.
+    """
+    index: int
+    options: FleetOptions
+
+    def __init__(self, index: int, seed: int, options: FleetOptions, start_date: int):
+        self.index = index
+        self.options = options
+        self._rng = random.Random(f'{seed}-{index}')
+        self._now = start_date + self._rng.randrange(60_000)  # ms, simulated
+        self._brand, self._model, self._os_name, self._os_version = self._rng.choice(devices)
+        self._source = 'ios' if self._brand == 'Apple' else 'android'
+        self._service = 'example-game'
+        self._version = f'1.{self._rng.randrange(3)}.0'
+        self._session = None
+        self._view = None
+        self._pending_records = []
+        self._start_session()
+
+    def next_batch(self) -> [Payload]:
+        rng = self._rng
+        interval = max(self.options.batch_interval, 1) * 1000  # simulated time still advances with no interval
+        batch_end = self._now + interval
+        events = []
+        logs = []
+        actions = rng.randint(0, 2 * self.options.actions_per_batch)
+        for _ in range(actions):
+            self._now += rng.randrange(int(interval / (actions + 1)) + 1)
+            events.extend(self._user_action())
+        for _ in range(rng.randint(0, 2 * self.options.logs_per_batch)):
+            logs.append(self._log(date=self._now - rng.randrange(int(interval))))
+        self._now = batch_end
+        events.append(self._view_update())
+        if self._view['ends_at'] <= self._now:
+            self._end_view()
+            events.append(self._view_update(is_active=False))
+            events.extend(self._next_view())
+
+        payloads = [self._rum_payload(events)]
+        if logs:
+            payloads.append(self._logs_payload(sorted(logs, key=lambda log: log['date'])))
+        if self._pending_records:
+            payloads.append(self._replay_payload())
+        return payloads
+
+    # Sessions and views
+
+    def _start_session(self):
+        self._session = {
+            'id': self._uuid(),
+            'has_replay': self._rng.random() < self.options.replay_sample_rate,
+            'views_left': max(1, round(self._rng.gauss(self.options.views_per_session, 2))),
+        }
+        self._start_view()
+
+    def _start_view(self):
+        scene = self._rng.choice(scenes)
+        self._view = {
+            'id': self._uuid(),
+            'name': scene,
+            'url': scene,
+            'started_at': self._now,
+            'ends_at': self._now + self._rng.randrange(10_000, 120_000),
+            'document_version': 0,
+            'action': 0, 'error': 0, 'resource': 0, 'long_task': 0, 'frozen_frame': 0, 'crash': 0,
+            'wireframes': self._rng.randrange(3, 12),
+        }
+        self._session['views_left'] -= 1
+        self._record(type=4, data={'width': 1080, 'height': 2340, 'href': scene})
+        self._record(type=6, data={'has_focus': True})
+        self._record(type=10, data={'wireframes': [self._wireframe(id) for id in range(self._view['wireframes'])]})
+
+    def _end_view(self):
+        self._record(type=7)
+
+    def _next_view(self) -> [dict]:
+        if self._session['views_left'] > 0:
+            self._start_view()
+            return [self._view_update()]
+        self._now += self._rng.randrange(1_000, 30_000)  # app in background, then new session
+        self._start_session()
+        return [self._action(type='application_start'), self._view_update()]
+
+    # RUM events
+
+    def _user_action(self) -> [dict]:
+        rng = self._rng
+        events = [self._action(type=rng.choice(['tap', 'tap', 'tap', 'swipe', 'scroll', 'back', 'custom']))]
+        self._record(type=11, data={'source': 2, 'positions': [
+            {'id': 0, 'x': rng.randrange(1080), 'y': rng.randrange(2340), 'timestamp': self._now}
+        ]})
+        self._record(type=11, data={'source': 0, 'adds': [], 'removes': [], 'updates': [
+            {'id': rng.randrange(self._view['wireframes']), 'type': 'shape',
+             'x': rng.randrange(1080), 'y': rng.randrange(2340)}
+        ]})
+        for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+            events.append(self._resource())
+        roll = rng.random()
+        if roll < 0.05:
+            events.append(self._error())
+        elif roll < 0.15:
+            events.append(self._long_task())
+        return events
+
+    def _action(self, type: str) -> dict:
+        self._view['action'] += 1
+        action = {'id': self._uuid(), 'type': type}
+        if type != 'application_start':
+            action['target'] = {'name': f'Button{self._rng.randrange(20)}'}
+        else:
+            action['loading_time'] = self._rng.randrange(500_000_000, 5_000_000_000)  # ns
+        return self._event(type='action', action=action)
+
+    def _resource(self) -> dict:
+        rng = self._rng
+        self._view['resource'] += 1
+        host = rng.choice(resource_hosts)
+        is_api = host.startswith('https://api')
+        path = f'/v1/{rng.choice(["players", "scores", "inventory", "events"])}' if is_api \
+            else f'/assets/{rng.randrange(1000)}.{rng.choice(["png", "bundle", "json"])}'
+        return self._event(type='resource', resource={
+            'id': self._uuid(),
+            'type': 'native',
+            'method': rng.choice(['GET', 'GET', 'POST']) if is_api else 'GET',
+            'url': host + path,
+            'status_code': rng.choice([200] * 18 + [404, 500]),
+            'duration': rng.randrange(20_000_000, 2_000_000_000),  # ns
+            'size': rng.randrange(200, 2_000_000),
+        })
+
+    def _error(self) -> dict:
+        rng = self._rng
+        self._view['error'] += 1
+        error_type = rng.choice(['NullReferenceException', 'IndexOutOfRangeException', 'InvalidOperationException'])
+        return self._event(type='error', error={
+            'id': self._uuid(),
+            'message': f'{error_type}: Object reference not set to an instance of an object',
+            'source': rng.choice(['source', 'logger', 'network']),
+            'type': error_type,
+            'stack': f'{error_type}\n  at GameController.Update () [0x00012] in GameController.cs:{rng.randrange(400)}',
+            'is_crash': False,
+        })
+
+    def _long_task(self) -> dict:
+        rng = self._rng
+        is_frozen_frame = rng.random() < 0.3
+        self._view['long_task'] += 1
+        self._view['frozen_frame'] += 1 if is_frozen_frame else 0
+        duration = rng.randrange(700_000_000, 2_000_000_000) if is_frozen_frame \
+            else rng.randrange(100_000_000, 700_000_000)
+        return self._event(type='long_task', long_task={'id': self._uuid(), 'duration': duration,
+                                                        'is_frozen_frame': is_frozen_frame})
+
+    def _view_update(self, is_active: bool = True) -> dict:
+        view = self._view
+        view['document_version'] += 1
+        return self._event(type='view', view={
+            'time_spent': (self._now - view['started_at']) * 1_000_000,  # ns
+            'is_active': is_active,
+            **{name: {'count': view[name]} for name in ['action', 'error', 'resource', 'long_task', 'frozen_frame',
+                                                         'crash']},
+        }, _dd={'document_version': view['document_version']})
+
+    def _event(self, type: str, view: Optional[dict] = None, _dd: Optional[dict] = None, **attributes) -> dict:
+        return {
+            'type': type,
+            'date': self._now if type != 'view' else self._view['started_at'],
+            'application': {'id': application_id},
+            'session': {'id': self._session['id'], 'type': 'user', 'has_replay': self._session['has_replay']},
+            'view': {'id': self._view['id'], 'url': self._view['url'], 'name': self._view['name']} | (view or {}),
+            'source': 'unity',
+            'service': self._service,
+            'version': self._version,
+            'connectivity': {'status': 'connected', 'interfaces': ['wifi']},
+            'device': {'type': 'mobile', 'name': f'{self._brand} {self._model}', 'model': self._model,
+                       'brand': self._brand},
+            'os': {'name': self._os_name, 'version': self._os_version,
+                   'version_major': self._os_version.split('.')[0]},
+            '_dd': {'format_version': 2} | (_dd or {}),
+        } | attributes
+
+    # Logs
+
+    def _log(self, date: int) -> dict:
+        rng = self._rng
+        status = rng.choice(['debug', 'info', 'info', 'info', 'warn', 'error'])
+        return {
+            'date': datetime.datetime.fromtimestamp(date / 1000, tz=datetime.timezone.utc).isoformat(
+                timespec='milliseconds').replace('+00:00', 'Z'),
+            'status': status,
+            'message': f'{rng.choice(["Loaded", "Saved", "Synced"])} {rng.choice(["level", "profile", "item"])} '
+                       f'{rng.randrange(100)}',
+            'service': self._service,
+            'ddtags': f'env:fleet,version:{self._version},sdk_version:{sdk_version}',
+            'logger': {'name': 'Unity', 'thread_name': 'main', 'version': sdk_version},
+            '_dd': {'device': {'architecture': 'arm64'}},
+            'network': {'client': {'connectivity': 'wifi'}},
+            'application_id': application_id,
+            'session_id': self._session['id'],
+            'view.id': self._view['id'],
+        }
+
+    # Session Replay
+
+    def _wireframe(self, id: int) -> dict:
+        rng = self._rng
+        if rng.random() < 0.5:
+            return {'id': id, 'type': 'shape', 'x': rng.randrange(1080), 'y': rng.randrange(2340),
+                    'width': rng.randrange(50, 1080), 'height': rng.randrange(50, 600),
+                    'shapeStyle': {'backgroundColor': f'#{rng.getrandbits(24):06x}ff', 'opacity': 1}}
+        return {'id': id, 'type': 'text', 'x': rng.randrange(1080), 'y': rng.randrange(2340),
+                'width': rng.randrange(100, 1080), 'height': rng.randrange(40, 120), 'text': f'Label {id}',
+                'textStyle': {'family': 'sans-serif', 'size': rng.randrange(12, 32), 'color': '#000000ff'}}
+
+    def _record(self, type: int, data: Optional[dict] = None):
+        if not self._session['has_replay']:
+            return
+        record = {'type': type, 'timestamp': self._now}
+        if data is not None:
+            record['data'] = data
+        self._pending_records.append(((self._session['id'], self._view['id']), record))
+
+    # Uploads
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self._rng.getrandbits(128), version=4))
+
+    def _headers(self) -> dict:
+        return {
+            'DD-API-KEY': 'fleet-api-key',
+            'DD-EVP-ORIGIN': 'unity',
+            'DD-EVP-ORIGIN-VERSION': sdk_version,
+            'DD-REQUEST-ID': self._uuid(),
+            'User-Agent': f'Datadog/{sdk_version} ({self._os_name} {self._os_version}; {self._model})',
+        }
+
+    def _query(self) -> str:
+        return f'ddsource=unity&ddtags=service:{self._service},version:{self._version},sdk_version:{sdk_version},' \
+               f'env:fleet'
+
+    def _rum_payload(self, events: [dict]) -> Payload:
+        return Payload(
+            path=f'/api/v2/rum?{self._query()}&batch_time={self._now}',
+            headers=self._headers() | {'Content-Type': 'text/plain;charset=UTF-8', 'Content-Encoding': 'gzip'},
+            body=gzip.compress('\n'.join(json.dumps(e, separators=(',', ':')) for e in events).encode('utf-8'),
+                               mtime=0)  # no timestamp in gzip header, so payloads are reproducible
+        )
+
+    def _logs_payload(self, logs: [dict]) -> Payload:
+        return Payload(
+            path=f'/api/v2/logs?{self._query()}',
+            headers=self._headers() | {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+            body=gzip.compress(json.dumps(logs, separators=(',', ':')).encode('utf-8'), mtime=0)
+        )
+
+    def _replay_payload(self) -> Payload:
+        """
+        One segment per upload, for the view with the oldest pending records (as in the native SDKs,
+        a segment never spans views). Its records are deflated (zlib) in the `segment` part.
+        """
+        session_id, view_id = key = self._pending_records[0][0]
+        records = [record for k, record in self._pending_records if k == key]
+        self._pending_records = [(k, record) for k, record in self._pending_records if k != key]
+        segment = {
+            'application': {'id': application_id},
+            'session': {'id': session_id},
+            'view': {'id': view_id},
+            'start': records[0]['timestamp'],
+            'end': records[-1]['timestamp'],
+            'records': records,
+            'records_count': len(records),
+            'has_full_snapshot': any(r['type'] == 10 for r in records),
+            'source': self._source,
+        }
+        segment_bytes = zlib.compress(json.dumps(segment, separators=(',', ':')).encode('utf-8'))
+        metadata = {key: value for key, value in segment.items() if key != 'records'}
+        metadata['raw_segment_size'] = len(segment_bytes)
+        boundary = self._uuid()
+        body = b''.join([
+            f'--{boundary}\r\nContent-Disposition: form-data; name="segment"; filename="{self._uuid()}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'), segment_bytes,
+            f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="event"; filename="blob"\r\n'
+            f'Content-Type: application/json\r\n\r\n'.encode('utf-8'), json.dumps([metadata]).encode('utf-8'),
+            f'\r\n--{boundary}--\r\n'.encode('utf-8'),
+        ])
+        return Payload(
+            path=f'/api/v2/replay?{self._query()}',
+            headers=self._headers() | {'Content-Type': f'multipart/form-data; boundary={boundary}'},
+            body=body
+        )
+
+
+def run_fleet(target: str, devices: int, batches: int, options: FleetOptions, concurrency: int, seed: int,
+              start_date: int) -> ReplayReport:
+    """
+    Simulates `devices` devices each uploading `batches` batches, every `options.batch_interval` seconds
+    (devices start at random offsets within the first interval). Uploads are sent over `concurrency` connections.
+    """
+    url = urlsplit(target)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    base_path = url.path.rstrip('/')
+    pending = queue.Queue(maxsize=concurrency * 4)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def send_payloads():
+        connection = connection_class(url.netloc)
+        while (payload := pending.get()) is not None:
+            start = time.monotonic()
+            try:
+                connection.request('POST', base_path + payload.path, body=payload.body, headers=payload.headers)
+                response = connection.getresponse()
+                response.read()
+                failed = not 200 <= response.status < 300
+            except (OSError, http.client.HTTPException) as error:
+                print(f'⚠️ Upload failed: {error}')
+                connection.close()
+                connection = connection_class(url.netloc)
+                failed = True
+            latency = time.monotonic() - start
+            with lock:
+                latencies.append(latency)
+                errors[0] += 1 if failed else 0
+        connection.close()
+
+    workers = [threading.Thread(target=send_payloads, daemon=True) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+
+    fleet = [Device(index=i, seed=seed, options=options, start_date=start_date) for i in range(devices)]
+    offsets = random.Random(seed)
+    schedule = [(offsets.random() * options.batch_interval, i, 0) for i in range(devices)]  # (due, device, batch)
+    heapq.heapify(schedule)
+    start = time.monotonic()
+    while schedule:
+        due, index, batch = heapq.heappop(schedule)
+        if (delay := start + due - time.monotonic()) > 0:
+            time.sleep(delay)
+        for payload in fleet[index].next_batch():
+            pending.put(payload)
+        if batch + 1 < batches:
+            heapq.heappush(schedule, (due + options.batch_interval, index, batch + 1))
+    for _ in workers:
+        pending.put(None)
+    for worker in workers:
+        worker.join()
+
+    return ReplayReport(requests=len(latencies), errors=errors[0], duration=time.monotonic() - start,
+                        latencies=latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulates a fleet of devices running a Unity app with the SDK, "
+                                                 "uploading RUM events, logs and Session Replay segments.")
+    parser.add_argument("--target", default='http://127.0.0.1:5000',
+                        help="Base URL uploads are sent to (defaults to http://127.0.0.1:5000)")
+    parser.add_argument("--devices", type=int, default=10, help="Number of simulated devices")
+    parser.add_argument("--batches", type=int, default=10, help="Number of batches uploaded by each device")
+    parser.add_argument("--batch-interval", type=float, default=5,
+                        help="Seconds between two batches of the same device (defaults to 5, 0 sends as fast "
+                             "as possible)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of concurrent connections")
+    parser.add_argument("--actions-per-batch", type=int, default=5, help="Average number of user actions per batch")
+    parser.add_argument("--logs-per-batch", type=int, default=5, help="Average number of logs per batch (0 disables)")
+    parser.add_argument("--replay-sample-rate", type=float, default=1,
+                        help="Fraction of sessions with Session Replay (defaults to 1, 0 disables)")
+    parser.add_argument("--views-per-session", type=int, default=5, help="Average number of views per session")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of generated traffic")
+    parser.add_argument("--start-date", type=datetime.datetime.fromisoformat, default='2023-11-14T00:00:00+00:00',
+                        help="Simulated date at which devices start (ISO 8601, fixed so that payloads are "
+                             "reproducible)")
+    parser.add_argument("--json", action='store_true', help="Print results as JSON")
+
+    args = parser.parse_args()
+    if args.devices < 1 or args.batches < 1 or args.concurrency < 1 or args.batch_interval < 0:
+        parser.error('--devices, --batches and --concurrency must be at least 1 and --batch-interval positive')
+    if not 0 <= args.replay_sample_rate <= 1:
+        parser.error('--replay-sample-rate must be between 0 and 1')
+
+    options = FleetOptions(actions_per_batch=args.actions_per_batch, logs_per_batch=args.logs_per_batch,
+                           replay_sample_rate=args.replay_sample_rate, views_per_session=args.views_per_session,
+                           batch_interval=args.batch_interval)
+    report = run_fleet(target=args.target, devices=args.devices, batches=args.batches, options=options,
+                       concurrency=args.concurrency, seed=args.seed,
+                       start_date=int(args.start_date.timestamp() * 1000))
+    print(json.dumps(report.as_json(), indent=2) if args.json else report.describe())
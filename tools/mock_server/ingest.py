@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import queue
+import threading
+import traceback
+from typing import Callable, Optional
+
+
+class IngestQueue:
+    """
+    Bounded queue of uploads accepted by `generic_post` and processed (decoded, parsed, validated and recorded)
+    by background workers, so uploads are acknowledged without waiting for that work.
+    When the queue is full, `submit()` blocks until workers catch up.
+    """
+    workers: int
+    max_pending: int
+    accepted: int  # number of uploads submitted
+    processed: int  # number of uploads done processing (successfully or not)
+    failed: int
+
+    def __init__(self, process: Callable[[object], None], workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.accepted = 0
+        self.processed = 0
+        self.failed = 0
+        self._process = process
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._progress = threading.Condition()
+        self._threads = []
+
+    @property
+    def pending(self) -> int:
+        return self.accepted - self.processed
+
+    def submit(self, item):
+        with self._progress:
+            if not self._threads:  # started lazily, in the process serving requests
+                self._threads = [threading.Thread(target=self._work, name=f'ingest-{i}', daemon=True)
+                                 for i in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+            self.accepted += 1
+        self._queue.put(item)
+
+    def wait_until_processed(self, timeout: float, target: Optional[int] = None) -> bool:
+        """
+        Blocks until the first `target` uploads (all uploads accepted so far, by default) are processed
+        or `timeout` (in seconds) expires. Returns `False` on timeout.
+        """
+        with self._progress:
+            target = self.accepted if target is None else target
+            return self._progress.wait_for(lambda: self.processed >= target, timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._progress:
+            return {
+                "accepted": self.accepted,
+                "processed": self.processed,
+                "failed": self.failed,
+                "pending": self.pending,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+            }
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            failed = False
+            try:
+                self._process(item)
+            except Exception:
+                print(f'⚠️ Could not process upload:\n{traceback.format_exc()}')
+                failed = True
+            with self._progress:
+                self.processed += 1
+                self.failed += 1 if failed else 0
+                self._progress.notify_all()
@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import json
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+from typing import Callable, Iterator, Optional
+
+# One index entry per record: seq, endpoint number, segment number, timestamp, offset, length
+index_entry = struct.Struct('<QIIdQI')
+metadata_length = struct.Struct('<I')
+
+
+class JournalEntry:
+    """
+    One request read back from the journal: its metadata is loaded, its body is read from disk on demand.
+    """
+    __slots__ = ('seq', 'endpoint', 'timestamp', 'metadata', '_journal', '_segment', '_offset', '_length')
+
+    seq: int
+    endpoint: str  # 'METHOD /path'
+    timestamp: float
+    metadata: dict
+
+    def __init__(self, journal: 'Journal', seq: int, endpoint: str, timestamp: float, metadata: dict,
+                 segment: int, body_offset: int, body_length: int):
+        self._journal = journal
+        self.seq = seq
+        self.endpoint = endpoint
+        self.timestamp = timestamp
+        self.metadata = metadata
+        self._segment = segment
+        self._offset = body_offset
+        self._length = body_length
+
+    def read_body(self) -> bytes:
+        return self._journal.read(segment=self._segment, offset=self._offset, length=self._length)
+
+
+class Journal:
+    """
+    Segmented, append-only journal of recorded requests, stored in `directory`:
+    - `segment-NNNNNN.log`: records (metadata length, JSON metadata and original body) appended one after another;
+    - `index`: fixed-size entries locating each record (see `index_entry`);
+    - `endpoints`: one `METHOD /path` line per endpoint, numbered in order of appearance.
+
+    Records are written by a background thread. The index entry of a record is written only after the record,
+    so the index never points to incomplete data. Bodies are read back with `mmap`, without loading segments.
+
+    With `read_only`, the journal can only be read (e.g. by `replay.py`), while a server may still be writing to it.
+    """
+    directory: str
+    segment_size: int  # a new segment is started when the current one gets bigger than this
+    read_only: bool
+    written_records: int
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024, read_only: bool = False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.read_only = read_only
+        self.written_records = 0
+        self._endpoint_numbers = {}  # 'METHOD /path' -> number
+        self._endpoint_names = []
+        self._maps = {}  # segment number -> mmap
+        self._maps_lock = threading.Lock()
+        self._queue = queue.Queue()
+        if read_only:
+            if not os.path.exists(self._path('index')):
+                raise FileNotFoundError(f'No journal in {directory}')
+            self._load_endpoints()
+        else:
+            self._open(first_segment=1)
+            self._writer = threading.Thread(target=self._write_records, name='journal-writer', daemon=True)
+            self._writer.start()
+
+    def entries(self) -> Iterator[JournalEntry]:
+        """
+        Entries of all records written to the journal, in order.
+        """
+        with open(self._path('index'), 'rb') as index:
+            while len(data := index.read(index_entry.size)) == index_entry.size:
+                seq, endpoint_no, segment, timestamp, offset, length = index_entry.unpack(data)
+                if endpoint_no >= len(self._endpoint_names):  # added by a server writing to the journal meanwhile
+                    self._load_endpoints()
+                meta_length, = metadata_length.unpack(self.read(segment=segment, offset=offset,
+                                                                length=metadata_length.size))
+                offset += metadata_length.size
+                metadata = json.loads(self.read(segment=segment, offset=offset, length=meta_length))
+                yield JournalEntry(journal=self, seq=seq, endpoint=self._endpoint_names[endpoint_no],
+                                   timestamp=timestamp, metadata=metadata, segment=segment,
+                                   body_offset=offset + meta_length,
+                                   body_length=length - metadata_length.size - meta_length)
+
+    def append(self, seq: int, endpoint: str, timestamp: float, metadata: dict, body: bytes,
+               on_written: Optional[Callable[[JournalEntry], None]] = None):
+        """
+        Queues a record for the background writer. `on_written(entry)` is called on the writer thread
+        once the record is on disk.
+        """
+        if self.read_only:
+            raise RuntimeError('Cannot append to a journal open in read-only mode')
+        self._queue.put((seq, endpoint, timestamp, metadata, body, on_written))
+
+    @property
+    def pending_records(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self):
+        """
+        Blocks until all records appended so far are written.
+        """
+        self._queue.join()
+
+    def read(self, segment: int, offset: int, length: int) -> bytes:
+        with self._maps_lock:
+            mapped = self._maps.get(segment)
+            if mapped is None or offset + length > len(mapped):  # not mapped yet or mapped before it grew
+                if mapped is not None:
+                    mapped.close()
+                with open(self._path(segment_name(segment)), 'rb') as f:
+                    mapped = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return mapped[offset:offset + length]
+
+    def clear(self):
+        """
+        Deletes all records. Bodies of deleted records can't be read anymore.
+        """
+        self.flush()
+        self._queue.put(None)  # processed by the writer, so it doesn't race with writes
+        self._queue.join()
+
+    def _load_endpoints(self):
+        if os.path.exists(self._path('endpoints')):
+            with open(self._path('endpoints'), 'r', encoding='utf-8') as f:
+                self._endpoint_names = f.read().splitlines()
+            self._endpoint_numbers = {name: no for no, name in enumerate(self._endpoint_names)}
+
+    def _open(self, first_segment: int):
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_endpoints()
+
+        # Drop the trailing partial entry, if the server was stopped while writing it:
+        index_path = self._path('index')
+        index_size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+        with open(index_path, 'ab') as index:
+            index.truncate(index_size - index_size % index_entry.size)
+        self.written_records = index_size // index_entry.size
+
+        segments = sorted(int(match.group(1)) for name in os.listdir(self.directory)
+                          if (match := segment_name_pattern.fullmatch(name)))
+        self._open_segment(segments[-1] if segments else first_segment)
+        self._index_file = open(index_path, 'ab')
+        self._endpoints_file = open(self._path('endpoints'), 'a', encoding='utf-8')
+
+    def _open_segment(self, segment: int):
+        self._segment = segment
+        self._segment_file = open(self._path(segment_name(segment)), 'ab')
+        self._segment_file.seek(0, os.SEEK_END)
+
+    def _close(self):
+        for f in [self._segment_file, self._index_file, self._endpoints_file]:
+            f.close()
+        with self._maps_lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+    def _write_records(self):
+        while True:
+            records = [self._queue.get()]
+            while len(records) < 1000:  # write queued records in one batch, then flush once
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                written = []
+                for record in records:
+                    if record is None:
+                        self._commit(written)
+                        written = []
+                        self._delete_records()
+                    else:
+                        written.append(self._write_record(*record))
+                self._commit(written)
+            except OSError as error:
+                print(f'⚠️ Could not write to the journal: {error}')
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+
+    def _commit(self, written: [tuple]):
+        """
+        Flushes written records, then writes their index entries and notifies their `on_written` callbacks.
+        """
+        self._segment_file.flush()
+        self._endpoints_file.flush()
+        for (data, entry, on_written) in written:
+            self._index_file.write(data)
+        self._index_file.flush()
+        for (data, entry, on_written) in written:
+            self.written_records += 1
+            if on_written:
+                on_written(entry)
+
+    def _write_record(self, seq: int, endpoint: str, timestamp: float, metadata: dict, body: bytes,
+                      on_written: Optional[Callable[[JournalEntry], None]]):
+        if self._segment_file.tell() > self.segment_size:
+            self._segment_file.close()
+            self._open_segment(self._segment + 1)
+        if (endpoint_no := self._endpoint_numbers.get(endpoint)) is None:
+            endpoint_no = self._endpoint_numbers[endpoint] = len(self._endpoint_names)
+            self._endpoint_names.append(endpoint)
+            self._endpoints_file.write(f'{endpoint}\n')
+
+        meta = json.dumps(metadata).encode('utf-8')
+        offset = self._segment_file.tell()
+        self._segment_file.write(metadata_length.pack(len(meta)))
+        self._segment_file.write(meta)
+        self._segment_file.write(body)
+        length = metadata_length.size + len(meta) + len(body)
+
+        data = index_entry.pack(seq, endpoint_no, self._segment, timestamp, offset, length)
+        entry = JournalEntry(journal=self, seq=seq, endpoint=endpoint, timestamp=timestamp, metadata=metadata,
+                             segment=self._segment, body_offset=offset + metadata_length.size + len(meta),
+                             body_length=len(body))
+        return data, entry, on_written
+
+    def _delete_records(self):
+        self._close()
+        # Only files of the journal are deleted: the directory is given by the user and may hold anything else
+        for name in os.listdir(self.directory):
+            if name in ('index', 'endpoints') or segment_name_pattern.fullmatch(name):
+                os.remove(self._path(name))
+        self._endpoint_numbers = {}
+        self._endpoint_names = []
+        self.written_records = 0
+        self._open(first_segment=self._segment + 1)  # don't reuse numbers of segments still referenced by entries
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+
+segment_name_pattern = re.compile(r'segment-(\d+)\.log')  # see `segment_name()`
+
+
+def segment_name(segment: int) -> str:
+    return f'segment-{segment:06d}.log'
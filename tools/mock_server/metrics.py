@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+default_buckets = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+
+
+class ThreadShards:
+    """
+    Values of a metric, sharded by thread: each thread only updates its own shard, so updating a metric takes
+    no lock. Shards are summed when metrics are collected. Shards of finished threads are merged into one.
+    """
+    def __init__(self, merge: Callable[[object, object], object]):
+        self._merge = merge  # (total, value) -> total + value
+        self._local = threading.local()
+        self._shards = []  # [(thread, shard)]
+        self._retired = {}  # values of finished threads
+        self._lock = threading.Lock()  # guards `_shards` and `_retired`, not shard contents
+
+    def shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def totals(self) -> dict:
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._add(self._retired, shard)
+            self._shards = alive
+            totals = {}
+            self._add(totals, self._retired)
+            for _, shard in alive:
+                self._add(totals, shard)
+            return totals
+
+    def _add(self, totals: dict, shard: dict):
+        for labels, value in list(shard.items()):  # copied at once, as the owning thread may add labels meanwhile
+            totals[labels] = self._merge(totals[labels], value) if labels in totals else self._merge(None, value)
+
+
+class Counter:
+    """
+    Monotonic counter, by values of `labels`.
+    """
+    name: str
+    help: str
+    labels: (str,)
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: (str,) = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = ThreadShards(merge=lambda total, value: (total or 0) + value)
+
+    def inc(self, *labels: str, value: float = 1):
+        shard = self._values.shard()
+        shard[labels] = shard.get(labels, 0) + value
+
+    def samples(self) -> Iterator[tuple]:
+        for labels, value in self._values.totals().items():
+            yield self.name, dict(zip(self.labels, labels)), value
+
+
+class Histogram:
+    """
+    Distribution of observed values (durations in seconds, by default), by values of `labels`.
+    """
+    name: str
+    help: str
+    labels: (str,)
+    buckets: (float,)  # upper bounds
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: (str,) = (), buckets: (float,) = default_buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # Each value is `[count in bucket 0, ..., count above last bucket, sum]`:
+        self._values = ThreadShards(merge=lambda total, value: [a + b for a, b in zip(total, value)] if total
+                                    else list(value))
+
+    def observe(self, value: float, *labels: str):
+        shard = self._values.shard()
+        if (counts := shard.get(labels)) is None:
+            counts = shard[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        """
+        Observes the duration of the `with` block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> Iterator[tuple]:
+        for labels, counts in self._values.totals().items():
+            labels = dict(zip(self.labels, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', labels | {'le': format_value(bound)}, cumulative
+            yield f'{self.name}_sum', labels, counts[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+class CollectedMetric:
+    """
+    Metric read from the server's state when metrics are collected (e.g. number of stored requests),
+    with `collect()` returning values by tuple of label values.
+    """
+    name: str
+    help: str
+    labels: (str,)
+    type: str  # 'gauge' or 'counter'
+
+    def __init__(self, name: str, help: str, type: str, labels: (str,), collect: Callable[[], dict]):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labels = labels
+        self._collect = collect
+
+    def samples(self) -> Iterator[tuple]:
+        for labels, value in self._collect().items():
+            yield self.name, dict(zip(self.labels, labels)), value
+
+
+class MetricsRegistry:
+    """
+    Metrics about the mock server itself, exposed by `/metrics` in Prometheus text format.
+    """
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, help: str, labels: (str,) = ()) -> Counter:
+        return self._register(Counter(name=name, help=help, labels=labels))
+
+    def histogram(self, name: str, help: str, labels: (str,) = (), buckets: (float,) = default_buckets) -> Histogram:
+        return self._register(Histogram(name=name, help=help, labels=labels, buckets=buckets))
+
+    def collected(self, name: str, help: str, type: str, labels: (str,), collect: Callable[[], dict]):
+        return self._register(CollectedMetric(name=name, help=help, type=type, labels=labels, collect=collect))
+
+    def exposition(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                if labels:
+                    label_pairs = ','.join(f'{key}="{escape_label_value(label)}"' for key, label in labels.items())
+                    lines.append(f'{name}{{{label_pairs}}} {format_value(value)}')
+                else:
+                    lines.append(f'{name} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+
+def escape_label_value(value) -> str:
+    return f'{value}'.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return f'{value}' if isinstance(value, int) else f'{value:.6g}' if value < 1e6 else f'{value:.0f}'
+
+
+metrics = MetricsRegistry()
+
+received_requests = metrics.counter('mock_server_received_requests_total', 'Requests received, by endpoint',
+                                    labels=('method', 'path'))
+received_bytes = metrics.counter('mock_server_received_bytes_total', 'Bytes received (as sent), by endpoint',
+                                 labels=('method', 'path'))
+decompression_seconds = metrics.histogram('mock_server_decompression_seconds',
+                                          'Time spent decompressing payloads, by encoding', labels=('encoding',))
+json_parse_seconds = metrics.histogram('mock_server_json_parse_seconds',
+                                       'Time spent parsing JSON payloads, by format', labels=('format',))
+validation_seconds = metrics.histogram('mock_server_validation_seconds',
+                                       'Time spent validating batches of events, by schema file', labels=('schema',))
+validated_events = metrics.counter('mock_server_validated_events_total', 'Events validated, by schema file',
+                                   labels=('schema',))
+validation_failures = metrics.counter('mock_server_validation_failures_total',
+                                      'Events not matching their schema, by schema file', labels=('schema',))
+validator_cache_lookups = metrics.counter('mock_server_validator_cache_lookups_total',
+                                          'Lookups of compiled validators in the server process (validation pool '
+                                          'workers have their own caches), by schema file and result (hit or miss)',
+                                          labels=('schema', 'result'))
+validator_cache_invalidations = metrics.counter('mock_server_validator_cache_invalidations_total',
+                                                'Compiled validators rebuilt because a schema file changed on disk, '
+                                                'by schema file', labels=('schema',))
+render_seconds = metrics.histogram('mock_server_render_seconds',
+                                   'Time spent rendering inspector pages and `/inspect_requests`, by view',
+                                   labels=('view',))
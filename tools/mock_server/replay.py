@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import argparse
+import http.client
+import queue
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+from journal import Journal, JournalEntry
+
+# Headers that belong to the recorded connection rather than to the upload, so they are not replayed:
+connection_headers = {'host', 'content-length', 'connection', 'keep-alive', 'transfer-encoding'}
+
+
+class ReplayReport:
+    """
+    Results of one replay: number of requests sent, failures and latencies (in seconds) of all requests.
+    """
+    requests: int
+    errors: int  # requests that failed or got a non-2xx response
+    duration: float  # seconds, from first request sent to last response received
+    latencies: [float]
+
+    def __init__(self, requests: int, errors: int, duration: float, latencies: [float]):
+        self.requests = requests
+        self.errors = errors
+        self.duration = duration
+        self.latencies = sorted(latencies)
+
+    def requests_per_second(self) -> float:
+        return self.requests / self.duration if self.duration > 0 else 0
+
+    def latency_percentile(self, percentile: float) -> float:
+        """
+        Latency (in seconds) under which `percentile`% of requests completed (nearest-rank method).
+        """
+        if not self.latencies:
+            return 0
+        rank = max(1, round(percentile / 100 * len(self.latencies)))
+        return self.latencies[min(rank, len(self.latencies)) - 1]
+
+    def as_json(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "duration_s": self.duration,
+            "requests_per_s": self.requests_per_second(),
+            "latency_ms": {
+                f'p{p}': self.latency_percentile(p) * 1000 for p in [50, 90, 99]
+            } | {"max": (self.latencies[-1] if self.latencies else 0) * 1000},
+        }
+
+    def describe(self) -> str:
+        latency = self.as_json()['latency_ms']
+        return '\n'.join([
+            f'requests:   {self.requests} ({self.errors} errors) in {self.duration:.2f} s',
+            f'throughput: {self.requests_per_second():.1f} req/s',
+            'latency:    ' + ', '.join(f'{name} {value:.1f} ms' for name, value in latency.items()),
+        ])
+
+
+def entry_headers(entry: JournalEntry) -> dict:
+    """
+    Original headers of the recorded request (including `Content-Encoding`), without connection headers.
+    """
+    headers = {}
+    for header in entry.metadata['headers']:
+        name, value = header.split(': ', 1)
+        if name.lower() not in connection_headers:
+            headers[name] = value
+    return headers
+
+
+def replay(entries: [JournalEntry], target: str, speed: Optional[float], concurrency: int) -> ReplayReport:
+    """
+    Sends `entries` to `target` (base URL) over `concurrency` connections. With `speed`, requests are sent
+    at their original inter-arrival times divided by `speed`. Without it, they are sent as fast as possible.
+    """
+    url = urlsplit(target)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    base_path = url.path.rstrip('/')
+    pending = queue.Queue(maxsize=concurrency * 2)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def send_requests():
+        connection = connection_class(url.netloc)
+        while (entry := pending.get()) is not None:
+            metadata = entry.metadata
+            body = entry.read_body()
+            start = time.monotonic()
+            try:
+                connection.request(metadata['method'], base_path + metadata['path'] + metadata['query_string'],
+                                   body=body, headers=entry_headers(entry))
+                response = connection.getresponse()
+                response.read()
+                failed = not 200 <= response.status < 300
+            except (OSError, http.client.HTTPException) as error:
+                print(f'⚠️ Request {entry.seq} failed: {error}')
+                connection.close()
+                connection = connection_class(url.netloc)
+                failed = True
+            latency = time.monotonic() - start
+            with lock:
+                latencies.append(latency)
+                errors[0] += 1 if failed else 0
+        connection.close()
+
+    workers = [threading.Thread(target=send_requests, daemon=True) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+
+    start = time.monotonic()
+    first_timestamp = None
+    for entry in entries:
+        if speed:
+            if first_timestamp is None:
+                first_timestamp = entry.timestamp
+            delay = start + (entry.timestamp - first_timestamp) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        pending.put(entry)
+    for _ in workers:
+        pending.put(None)
+    for worker in workers:
+        worker.join()
+
+    return ReplayReport(requests=len(latencies), errors=errors[0], duration=time.monotonic() - start,
+                        latencies=latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replays requests recorded with `app.py --journal DIR`.")
+    parser.add_argument("journal", metavar='DIR', help="Journal directory")
+    parser.add_argument("--target", default='http://127.0.0.1:5000',
+                        help="Base URL requests are sent to (defaults to http://127.0.0.1:5000)")
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument("--speed", type=float, default=1,
+                        help="Replay N times faster than recorded (defaults to 1, the original timing)")
+    timing.add_argument("--max-throughput", action='store_true',
+                        help="Send requests as fast as possible, ignoring recorded timing")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of concurrent connections")
+    parser.add_argument("--path", help="Only replay requests to endpoints with this path prefix")
+
+    args = parser.parse_args()
+    if args.speed <= 0 or args.concurrency < 1:
+        parser.error('--speed must be positive and --concurrency at least 1')
+
+    journal = Journal(directory=args.journal, read_only=True)
+    entries = (e for e in journal.entries() if not args.path or e.metadata['path'].startswith(args.path))
+    report = replay(entries=entries, target=args.target, speed=None if args.max_throughput else args.speed,
+                    concurrency=args.concurrency)
+    print(report.describe())
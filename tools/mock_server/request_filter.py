@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import datetime
+from typing import Optional
+from schemas.logs import LogsSchema
+from schemas.rum import RUMSchema
+
+# Fields that can be requested with `fields=`:
+request_fields = ['id', 'method', 'path', 'query_string', 'date', 'content_type', 'content_length', 'data_as_text',
+                  'timings']
+schema_fields = ['headers', 'data', 'decompressed_data']  # returned in `schemas` (RAW schema only)
+events_field = 'events'  # parsed RUM events
+logs_field = 'logs'  # parsed logs
+
+# RUM event attributes that can be filtered on, by query parameter:
+event_attributes = {
+    'type': ['type'],
+    'session.id': ['session', 'id'],
+    'view.id': ['view', 'id'],
+    'application.id': ['application', 'id'],
+}
+
+
+def event_attribute(event: dict, keys: [str]):
+    value = event
+    for key in keys:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+class RequestFilter:
+    """
+    Filter and projection of recorded requests, configured with query parameters:
+    - `since`: only keep requests with ID greater than this cursor;
+    - `path`: prefix of the endpoint path;
+    - `method`: HTTP method of the endpoint;
+    - `from`, `to`: ISO 8601 range of the date requests were received (`from` included, `to` excluded);
+    - `type`, `session.id`, `view.id`, `application.id`: only keep requests with at least one RUM event matching
+      all of these;
+    - `fields`: comma-separated list of fields to return for each request (all fields if not set).
+    """
+    since: Optional[int]
+    path_prefix: Optional[str]
+    method: Optional[str]
+    date_from: Optional[datetime.datetime]
+    date_to: Optional[datetime.datetime]
+    event_filters: dict  # query parameter -> expected value
+    fields: Optional[set]  # `None` for all fields
+
+    def __init__(self, args: dict):
+        self.since = int(args['since']) if args.get('since') else None
+        self.path_prefix = args.get('path')
+        self.method = args['method'].upper() if args.get('method') else None
+        self.date_from = RequestFilter._parse_date(args, 'from')
+        self.date_to = RequestFilter._parse_date(args, 'to')
+        self.event_filters = {name: args[name] for name in event_attributes if args.get(name)}
+        self.fields = None
+        if args.get('fields'):
+            self.fields = set(f.strip() for f in args['fields'].split(',') if f.strip())
+            known_fields = set(request_fields + schema_fields + [events_field, logs_field])
+            if unknown_fields := self.fields - known_fields:
+                raise ValueError(f'Unknown fields: {", ".join(sorted(unknown_fields))} '
+                                 f'(known fields: {", ".join(sorted(known_fields))})')
+
+    def is_active(self) -> bool:
+        return any([
+            self.since is not None, self.path_prefix, self.method,
+            self.date_from, self.date_to, self.event_filters, self.fields
+        ])
+
+    def matches_endpoint(self, method: str, path: str) -> bool:
+        if self.method is not None and method != self.method:
+            return False
+        if self.path_prefix is not None and not path.startswith(self.path_prefix):
+            return False
+        return True
+
+    def matches_request(self, request) -> bool:
+        if self.date_from is not None and request.date < self.date_from:
+            return False
+        if self.date_to is not None and request.date >= self.date_to:
+            return False
+        if self.event_filters:
+            return any(True for _ in self.matching_events(request))
+        return True
+
+    def matching_events(self, request):
+        """
+        Yields RUM events of the request that match all event filters.
+        """
+        if not RUMSchema.matches(request.method, request.path):
+            return
+        for event in request.body.ndjson_events:
+            if all(f'{event_attribute(event, event_attributes[name])}' == value
+                   for name, value in self.event_filters.items()):
+                yield event
+
+    def project(self, request) -> dict:
+        """
+        Returns JSON representation of the request, limited to requested fields.
+        """
+        fields = self.fields
+        obj = {}
+        for field in request_fields:
+            if field in fields:
+                value = getattr(request, field)
+                obj[field] = str(value) if isinstance(value, datetime.datetime) else value
+        if requested_schema_fields := [f for f in schema_fields if f in fields]:
+            raw = request.schema_with_name('raw').as_json()
+            obj['schemas'] = [{f: raw[f] for f in requested_schema_fields}]
+        if events_field in fields:
+            obj[events_field] = list(self.matching_events(request))
+        if logs_field in fields:
+            logs_schema = request.schema_with_name(LogsSchema.name)
+            obj[logs_field] = logs_schema.as_json() if logs_schema else []
+        return obj
+
+    @staticmethod
+    def _parse_date(args: dict, name: str) -> Optional[datetime.datetime]:
+        if not (value := args.get(name)):
+            return None
+        try:
+            date = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f'Invalid `{name}` date: {value} (expected ISO 8601 format)')
+        if date.tzinfo is not None:
+            date = date.astimezone().replace(tzinfo=None)  # recorded dates are in local time
+        return date
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+from abc import ABC, abstractmethod
+from hashlib import sha1
+from typing import Callable, Iterator, Optional
+from retention import RetentionPolicy
+
+
+def endpoint_hash(method: str, path: str) -> str:
+    return sha1(f'{method} {path}'.encode('utf-8')).hexdigest()
+
+
+class RequestStore(ABC):
+    """
+    Storage of recorded requests, behind `generic_post`, `/inspect_requests` and the inspector routes.
+    Implemented by `EndpointRegistry` (in memory, default) and `SQLiteRequestStore` (shared by processes).
+
+    Endpoints returned by stores expose `method`, `path`, `schemas`, `hash()`, `name()`, `requests`,
+    `requests_page()`, `requests_in_range()`, `request_with_id()`, `requests_count()`, `bytes_received()`,
+    `follow_url()`, `schema_with_name()`, the `evicted_requests` and `evicted_bytes` counters and `aggregates`
+    (running totals of stored requests, see `Aggregates`).
+    """
+    retention: RetentionPolicy
+    # Called with `('request', request)` and `('reset', None)`. `request` may be a reference with only `id`,
+    # `method` and `path` loaded: `request.load()` returns the request (`None` if it was evicted meanwhile).
+    on_event: Optional[Callable[[tuple], None]]
+    # Whether `on_event` has listeners (stores may skip the work of emitting events if not), `True` if `None`:
+    has_listeners: Optional[Callable[[], bool]]
+    evicted_requests: int  # number of requests dropped by retention policy, on all endpoints
+    evicted_bytes: int
+    aggregates: object  # `Aggregates` (or equivalent) of stored requests, on all endpoints
+
+    @property
+    @abstractmethod
+    def last_request_id(self) -> int:
+        """
+        ID of the most recently recorded request (`0` if none).
+        """
+
+    @abstractmethod
+    def __iter__(self) -> Iterator:
+        """
+        Known endpoints, in order of registration.
+        """
+
+    @abstractmethod
+    def endpoint(self, method: str, path: str):
+        pass
+
+    @abstractmethod
+    def endpoint_with_hash(self, hash: str):
+        pass
+
+    def endpoint_hash(self, method: str, path: str) -> str:
+        return endpoint_hash(method=method, path=path)
+
+    @abstractmethod
+    def record(self, request) -> bool:
+        """
+        Assigns the next ID to `request` and stores it. Returns `True` if the request was sent to a new endpoint.
+        """
+
+    @abstractmethod
+    def query_events(self, query) -> (int, [tuple]):
+        """
+        Returns the number of stored RUM events matching `query` (an `EventQuery`) and the requested page
+        of them, as `(request, index of the event in request)`. Served from indexes built when requests are recorded.
+        """
+
+    @abstractmethod
+    def count_validation(self):
+        """
+        Adds `validation_counts()` of stored requests recorded without them to `aggregates` (validating their
+        payload if needed). Run by a background thread started by `start()`, so neither recording requests
+        nor reading aggregates waits for validation: validation results lag behind recorded requests.
+        """
+
+    @abstractmethod
+    def wait_for_requests(self, after_id: int, timeout: float) -> bool:
+        """
+        Blocks until a request with ID greater than `after_id` is recorded or `timeout` (in seconds) expires.
+        Returns `False` on timeout.
+        """
+
+    @abstractmethod
+    def enforce_retention(self):
+        """
+        Evicts requests older than the retention policy allows.
+        """
+
+    @abstractmethod
+    def clear(self):
+        """
+        Deletes all requests and resets eviction counters.
+        """
+
+    def start(self):
+        """
+        Called in each process serving requests, before it handles the first one.
+        """
+        pass
+
+    def is_followed(self) -> bool:
+        return self.on_event is not None and (self.has_listeners is None or self.has_listeners())
+
+    def _emit(self, event: tuple):
+        if self.on_event:
+            self.on_event(event)
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import json
+import queue
+import threading
+from typing import Optional
+
+
+class Subscription:
+    """
+    Queue of items published to one subscriber of `RequestStream`. The queue is bounded: when
+    the subscriber doesn't keep up, new items are dropped (and counted) instead of blocking the publisher.
+    """
+    dropped: int  # number of items dropped since last call to `take_dropped()`
+
+    def __init__(self, max_pending: int):
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+
+    def offer(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def next(self, timeout: float):
+        """
+        Returns next item or `None` if nothing was published within `timeout` seconds.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def take_dropped(self) -> int:
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class RequestStream:
+    """
+    Publishes recorded requests to live subscribers (see `/inspect_stream`).
+    Publishing never blocks: summaries are built by subscribers, on their own thread.
+    """
+
+    def __init__(self, max_pending: int = 1000):
+        self._max_pending = max_pending
+        self._subscriptions = []
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(max_pending=self._max_pending)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscriptions)
+
+    def publish(self, item):
+        for subscription in self._subscriptions:  # copy-on-write list, no need to lock
+            subscription.offer(item)
+
+
+def server_sent_event(event: str, data: dict, id: Optional[int] = None) -> str:
+    """
+    Formats one event of `text/event-stream` response.
+    """
+    lines = [f'event: {event}']
+    if id is not None:
+        lines.append(f'id: {id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
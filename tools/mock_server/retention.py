@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import datetime
+from typing import Optional
+
+
+class RetentionPolicy:
+    """
+    Limits on requests kept by the mock server. When a limit is exceeded, oldest requests are evicted first.
+    `None` means no limit. In memory, the size of a request is its body as received plus the estimated size
+    of decoded and parsed views kept with it when it is recorded (none in compact storage mode, where they are
+    bounded by `--decoded-cache-size`). In SQLite, it is the size of the body as received.
+    """
+    max_requests: Optional[int]
+    max_bytes: Optional[int]
+    max_age: Optional[float]  # in seconds, applies to requests of all endpoints
+    max_requests_per_endpoint: Optional[int]
+    max_bytes_per_endpoint: Optional[int]
+
+    def __init__(self,
+                 max_requests: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 max_age: Optional[float] = None,
+                 max_requests_per_endpoint: Optional[int] = None,
+                 max_bytes_per_endpoint: Optional[int] = None):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_requests_per_endpoint = max_requests_per_endpoint
+        self.max_bytes_per_endpoint = max_bytes_per_endpoint
+
+    def is_bounded(self) -> bool:
+        return any(limit is not None for limit in [
+            self.max_requests, self.max_bytes, self.max_age, self.max_requests_per_endpoint, self.max_bytes_per_endpoint
+        ])
+
+    def exceeded(self, requests: int, bytes: int, oldest_date: datetime.datetime) -> bool:
+        if self.max_requests is not None and requests > self.max_requests:
+            return True
+        if self.max_bytes is not None and bytes > self.max_bytes:
+            return True
+        if self.max_age is not None and (datetime.datetime.now() - oldest_date).total_seconds() > self.max_age:
+            return True
+        return False
+
+    def endpoint_exceeded(self, requests: int, bytes: int) -> bool:
+        if self.max_requests_per_endpoint is not None and requests > self.max_requests_per_endpoint:
+            return True
+        if self.max_bytes_per_endpoint is not None and bytes > self.max_bytes_per_endpoint:
+            return True
+        return False
+
+    def as_json(self) -> dict:
+        return {
+            "max_requests": self.max_requests,
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            "max_requests_per_endpoint": self.max_requests_per_endpoint,
+            "max_bytes_per_endpoint": self.max_bytes_per_endpoint,
+        }
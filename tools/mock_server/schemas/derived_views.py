@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import itertools
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+
+class DerivedViewCache:
+    """
+    Process-wide LRU of views derived from recorded requests (validation results, pretty-printed JSON, ...),
+    so re-rendering a request doesn't compute them again. The cache is bounded by an approximate size in bytes:
+    least recently used views are dropped when it gets over budget and views bigger than the budget are not kept.
+    """
+    max_bytes: int
+    total_bytes: int
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._views = OrderedDict()  # (owner key, view name) -> (view, size)
+        self._lock = threading.Lock()
+
+    def get(self, owner_key: int, name: str, compute: Callable[[], tuple]):
+        """
+        Returns cached view or calls `compute()` to create it. `compute()` must return `(view, size in bytes)`.
+        """
+        key = (owner_key, name)
+        with self._lock:
+            if cached := self._views.get(key):
+                self._views.move_to_end(key)
+                return cached[0]
+
+        view, size = compute()
+        if size > self.max_bytes:
+            return view
+
+        with self._lock:
+            if key not in self._views:
+                self._views[key] = (view, size)
+                self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._views.popitem(last=False)
+                self.total_bytes -= evicted_size
+        return view
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+            self.total_bytes = 0
+
+
+derived_views = DerivedViewCache(max_bytes=256 * 1024 * 1024)
+owner_keys = itertools.count(start=1)  # unique key of each object owning derived views
+
+
+def configure_derived_views(max_bytes: int):
+    derived_views.clear()
+    derived_views.max_bytes = max_bytes
+
+
+def item_entry_size(entry: dict) -> int:
+    """
+    Approximate memory taken by an item entry of a derived view (`{'pills': [str], 'validation': result}`),
+    including the list slot referencing it, counted for `DerivedViewCache` budget.
+    """
+    pills, validation = entry['pills'], entry['validation']
+    size = 8 + sys.getsizeof(entry) + sys.getsizeof(pills) + sum(map(sys.getsizeof, pills))
+    if validation is not None:
+        size += sys.getsizeof(validation) + sys.getsizeof(vars(validation)) + sys.getsizeof(validation.schema_name)
+        if validation.error is not None:
+            size += sys.getsizeof(validation.error)
+    return size
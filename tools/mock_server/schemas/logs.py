@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import json
+import zlib
+from collections import Counter
+from typing import Iterable, Iterator, Optional
+from schemas.derived_views import item_entry_size
+from schemas.request_body import RequestBody, parsed_size_factor
+from schemas.schema import Schema, item_json
+from templates.components.card import Card, CardTab
+from templates.components.pagination import Pagination
+from templates.components.stat import Stat
+from metrics import json_parse_seconds
+
+
+logs_per_page = 50  # in inspector pages
+
+json_whitespace = ' \t\n\r'
+json_number_chars = frozenset('0123456789+-.eE')
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator:
+    """
+    Yields elements of the JSON array split in `chunks` of text, as soon as each of them is complete.
+    Only the text of the element being parsed is buffered, not the whole array.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0  # position of the next character to parse in `buffer`
+    exhausted = False
+    expected = '['  # '[', 'value or ]', 'value' or ', or ]'
+
+    def read_more() -> bool:
+        nonlocal buffer, pos, exhausted
+        for chunk in chunks:
+            if chunk:
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                return True
+        exhausted = True
+        return False
+
+    while True:
+        while True:  # skip whitespace, reading more text if needed
+            while pos < len(buffer) and buffer[pos] in json_whitespace:
+                pos += 1
+            if pos < len(buffer) or not read_more():
+                break
+        if pos == len(buffer):
+            raise ValueError('Unexpected end of JSON array')
+
+        char = buffer[pos]
+        if expected == '[':
+            if char != '[':
+                raise ValueError(f'Expected JSON array, found {char!r}')
+            pos += 1
+            expected = 'value or ]'
+        elif expected == ', or ]' or (expected == 'value or ]' and char == ']'):
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f'Expected "," or "]" in JSON array, found {char!r}')
+            pos += 1
+            expected = 'value'
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if exhausted or not read_more():
+                    raise
+                continue  # incomplete value: parse it again with more text
+            is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if not exhausted and (end == len(buffer) or is_number and json_number_chars.issuperset(buffer[end:])) \
+                    and read_more():
+                continue  # value may go on in the next chunk (e.g. `1.` then `5`): parse it again with more text
+            yield value
+            pos = end
+            expected = ', or ]'
+
+
+class LogsSchema(Schema):
+    name = 'logs'
+    pretty_name = 'Logs'
+    is_known = True
+    endpoint_template = 'logs/endpoint.html'
+    request_template = 'logs/request.html'
+    parse_errors = (ValueError, zlib.error)  # not a JSON array (or not decompressible): shown as RAW only
+
+    # Logs-specific:
+    __slots__ = ('body', 'logs_count', 'non_object_logs_count', 'logs_count_by_status', 'logs_count_by_service',
+                 'total_message_length', 'max_message_length')
+    body: RequestBody
+    logs_count: int
+    non_object_logs_count: int  # elements of the array that are not JSON objects (not counted below)
+    logs_count_by_status: dict  # log status -> number of logs
+    logs_count_by_service: dict  # service -> number of logs
+    total_message_length: int  # in characters
+    max_message_length: int  # in characters
+
+    def __init__(self, body: RequestBody):
+        self.body = body
+        log_jsons = self.log_jsons
+        objects = [log for log in log_jsons if isinstance(log, dict)]
+        self.logs_count = len(log_jsons)
+        self.non_object_logs_count = len(log_jsons) - len(objects)
+        self.logs_count_by_status = dict(Counter(f"{log.get('status')}" for log in objects))
+        self.logs_count_by_service = dict(Counter(f"{log.get('service')}" for log in objects))
+        message_lengths = [len(f"{log.get('message', '')}") for log in objects]
+        self.total_message_length = sum(message_lengths)
+        self.max_message_length = max(message_lengths, default=0)
+
+    @property
+    def log_jsons(self) -> [dict]:
+        """
+        Logs of the batch, parsed from the JSON array while it is decompressed and decoded in chunks,
+        so parsing does not need the decompressed payload as a whole (other views may still cache it,
+        e.g. `decompressed_text` for `/inspect_requests`).
+        """
+        def parse():
+            text_length = 0
+
+            def counted(chunks: Iterator[str]) -> Iterator[str]:
+                nonlocal text_length
+                for chunk in chunks:
+                    text_length += len(chunk)
+                    yield chunk
+
+            with self.body.timed('logs_parse', json_parse_seconds, 'logs'):
+                logs = list(iter_json_array(counted(self.body.text_chunks())))
+            return logs, parsed_size_factor * text_length
+
+        return self.body.decoded_view(name='logs', compute=parse)
+
+    @property
+    def stats(self) -> [Stat]:
+        objects_count = self.logs_count - self.non_object_logs_count
+        average_message_length = self.total_message_length / objects_count if objects_count else 0
+        return [
+            Stat(title='number of logs', value=f'{self.logs_count}'),
+            Stat(title='logs that are not objects', value=f'{self.non_object_logs_count}'),
+            Stat(title='logs by status', value=LogsSchema._format_counts(self.logs_count_by_status)),
+            Stat(title='logs by service', value=LogsSchema._format_counts(self.logs_count_by_service)),
+            Stat(title='message length (avg / max)', value=f'{average_message_length:.0f} / {self.max_message_length}'),
+        ]
+
+    def body_views_card(self, page: int = 1) -> Card:
+        return Card(
+            title='View as:',
+            tabs=[
+                self.logs_data(page=page),
+            ]
+        )
+
+    def logs_data(self, page: int) -> CardTab:
+        """
+        One page of logs. Log bodies are loaded on demand, with `items()`.
+        """
+        pagination = Pagination(page=page, per_page=logs_per_page, total=self.logs_count, anchor='logs')
+        logs = self.derived_view(name='logs_data', compute=self._compute_logs_data)['logs']
+        obj = {
+            'logs': logs[pagination.offset:pagination.end],
+            'pagination': pagination,
+        }
+        return CardTab(title=f'Logs ({self.logs_count})', template='logs/logs_view.html', object=obj, anchor='logs')
+
+    def _compute_logs_data(self) -> (dict, int):
+        obj = {
+            'logs': [],
+        }
+        size = 0
+
+        for log in self.log_jsons:
+            if isinstance(log, dict):
+                pills = [f"{log.get(key)}" for key in ('status', 'service', 'message') if key in log]
+            else:
+                pills = ['not an object', json.dumps(log)]
+            pills = [pill if len(pill) <= 80 else f'{pill[:80]}…' for pill in pills]  # rendered below log index
+            entry = {
+                'pills': pills,
+                'validation': None,  # there is no schema for logs
+            }
+            size += item_entry_size(entry)
+            obj['logs'].append(entry)
+
+        return obj, size
+
+    def items(self, name: str, offset: int, limit: int) -> Optional[tuple]:
+        if name != 'logs':
+            return None
+        log_jsons = self.log_jsons
+        logs = self.derived_view(name='logs_data', compute=self._compute_logs_data)['logs']
+        return len(log_jsons), [
+            item_json(index=index, json=log_jsons[index], pills=logs[index]['pills'], validation=None)
+            for index in range(offset, min(offset + limit, len(log_jsons)))
+        ]
+
+    def as_json(self) -> [dict]:
+        return self.log_jsons
+
+    def summary(self, validate: bool) -> dict:
+        return {'logs': dict(self.logs_count_by_status)}
+
+    @staticmethod
+    def _format_counts(counts: dict) -> str:
+        return ', '.join(f'{key}: {count}' for key, count in sorted(counts.items(), key=lambda kv: -kv[1])) or '-'
+
+    @staticmethod
+    def matches(method: str, path: str):
+        return method == 'POST' and path.startswith('/api/v2/logs')
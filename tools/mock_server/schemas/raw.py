@@ -6,10 +6,8 @@
 # Copyright 2019-2020 Datadog, Inc.
 # -----------------------------------------------------------
 
-import zlib
-import gzip
 from typing import Optional
-from flask import Request
+from schemas.request_body import RequestBody
 from schemas.schema import Schema
 from templates.components.card import Card, CardTab
 
@@ -22,20 +20,23 @@ class RAWSchema(Schema):
     request_template = 'raw/request.html'
 
     # RAW-specific:
-    headers: [str]  # ['field1: value1', 'field2: value2', ...]
-    data_as_text: str
-    decompressed_data: Optional[str]  # `None` if data was not compressed
-
-    def __init__(self, request: Request):
-        self.headers = list(map(lambda h: f'{h[0]}: {h[1]}', request.headers))
-        self.data_as_text = request.get_data(as_text=True)
-        encoding = request.headers.get('Content-Encoding', None)
-        if encoding == 'deflate':
-            self.decompressed_data = zlib.decompress(request.get_data()).decode('utf-8')
-        elif encoding == 'gzip':
-            self.decompressed_data = gzip.decompress(request.get_data()).decode('utf-8')
-        else:
-            self.decompressed_data = None
+    __slots__ = ('body',)
+    body: RequestBody
+
+    def __init__(self, body: RequestBody):
+        self.body = body
+
+    @property
+    def headers(self) -> (str,):
+        return self.body.headers  # ('field1: value1', 'field2: value2', ...)
+
+    @property
+    def data_as_text(self) -> str:
+        return self.body.data_as_text
+
+    @property
+    def decompressed_data(self) -> Optional[str]:
+        return self.body.decompressed_text  # `None` if data was not compressed
 
     def headers_card(self) -> Card:
         return Card(
@@ -57,7 +58,7 @@ class RAWSchema(Schema):
 
     def as_json(self) -> dict:
         return {
-            "headers": self.headers,
+            "headers": list(self.headers),
             "data": self.data_as_text,
             "decompressed_data": self.decompressed_data
         }
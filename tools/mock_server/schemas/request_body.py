@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import codecs
+import gzip
+import io
+import json
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Union
+from flask import Request
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_options_header
+from schemas.derived_views import DerivedViewCache, owner_keys
+from metrics import Histogram, decompression_seconds, json_parse_seconds
+
+
+class RequestBody:
+    """
+    Body of a recorded request, shared by all schemas matching that request.
+
+    The body is read from the request once. Decompression, UTF-8 decoding and parsing
+    are done lazily, on first access, and their results are kept for other schemas to reuse.
+
+    In compact storage mode (see `configure_compact_storage()`), only the original bytes are kept:
+    decoded views are kept in the process-wide `decoded_views` LRU and decoded again when evicted.
+    """
+    __slots__ = ('headers', 'content_type', 'content_encoding', 'size', 'decompressed_size', 'views_size', 'timings',
+                 '_data', '_views', '_owner_key')
+
+    headers: (str,)  # ('field1: value1', 'field2: value2', ...), interned
+    content_type: Optional[str]
+    content_encoding: Optional[str]
+    size: int  # number of original bytes
+    decompressed_size: Optional[int]  # number of bytes after decompression, `None` until data is decompressed
+    views_size: int  # estimated bytes of decoded views kept with the body (`0` in compact mode, see `decoded_view()`)
+    timings: dict  # processing stage -> duration in seconds, of its most recent run (see `timed()`)
+
+    def __init__(self, headers: [(str, str)], data: Union[bytes, Callable[[], bytes]], size: Optional[int] = None):
+        """
+        `data` is either the original bytes or a function reading them (e.g. from the journal), in which case
+        their `size` must be given.
+        """
+        self.headers = tuple(sys.intern(f'{k}: {v}') for k, v in headers)
+        self.content_type = next((sys.intern(v) for k, v in headers if k.lower() == 'content-type'), None)
+        self.content_encoding = next((sys.intern(v) for k, v in headers if k.lower() == 'content-encoding'), None)
+        self.size = len(data) if isinstance(data, bytes) else size
+        self.decompressed_size = self.size if self.content_encoding not in ['deflate', 'gzip'] else None
+        self.views_size = 0
+        self.timings = {}
+        self._data = data
+        self._views = None if compact_storage else {}  # decoded views kept with the body (`None` in compact mode)
+        self._owner_key = next(owner_keys)
+
+    @staticmethod
+    def from_request(request: Request) -> 'RequestBody':
+        start = time.perf_counter()
+        data = request.get_data()
+        body = RequestBody(headers=list(request.headers), data=data)
+        body.timings['read'] = time.perf_counter() - start
+        return body
+
+    @contextmanager
+    def timed(self, stage: str, histogram: Optional[Histogram] = None, *labels: str):
+        """
+        Records how long the `with` block takes as the duration of `stage` in `timings`
+        (and in `histogram` with `labels`, if given).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.timings[stage] = duration
+            if histogram is not None:
+                histogram.observe(duration, *labels)
+
+    @property
+    def data(self) -> bytes:
+        """
+        Original bytes, as sent by the client.
+        """
+        data = self._data
+        return data if isinstance(data, bytes) else data()
+
+    def offload(self, read_data: Callable[[], bytes]):
+        """
+        Releases original bytes from memory. From now on, they are read with `read_data()` when needed.
+        """
+        self._data = read_data
+
+    @property
+    def is_compact(self) -> bool:
+        return self._views is None
+
+    def decoded_view(self, name: str, compute: Callable[[], tuple]):
+        """
+        Returns the view named `name`, computed once with `compute()`. `compute()` must return
+        `(view, size in bytes)`. The size bounds `decoded_views` in compact storage mode, and is added to
+        `views_size` otherwise.
+        """
+        if self._views is None:
+            return decoded_views.get(owner_key=self._owner_key, name=name, compute=compute)
+        if name not in self._views:
+            view, size = compute()
+            self._views[name] = view
+            self.views_size += size
+        return self._views[name]
+
+    @property
+    def data_as_text(self) -> str:
+        """
+        Original bytes decoded as text (undecodable bytes are replaced).
+        """
+        return self.decoded_view(name='data_as_text', compute=lambda: (
+            self.data.decode('utf-8', errors='replace'), self.size
+        ))
+
+    @property
+    def decompressed_data(self) -> Optional[bytes]:
+        """
+        Decompressed bytes or `None` if data was not compressed.
+        """
+        if self.content_encoding not in ['deflate', 'gzip']:
+            return None
+
+        def decompress():
+            data = self.data
+            with self.timed('decompression', decompression_seconds, self.content_encoding):
+                if self.content_encoding == 'deflate':
+                    decompressed = zlib.decompress(data)
+                else:
+                    decompressed = gzip.decompress(data)
+            self.decompressed_size = len(decompressed)
+            return decompressed, len(decompressed)
+
+        return self.decoded_view(name='decompressed_data', compute=decompress)
+
+    @property
+    def decompressed_text(self) -> Optional[str]:
+        """
+        Decompressed bytes decoded as UTF-8 or `None` if data was not compressed.
+        """
+        if self.decompressed_data is None:
+            return None
+        def decode():
+            decompressed_data = self.decompressed_data
+            with self.timed('decoding'):
+                return decompressed_data.decode('utf-8'), len(decompressed_data)
+
+        return self.decoded_view(name='decompressed_text', compute=decode)
+
+    @property
+    def text(self) -> str:
+        """
+        Payload decoded as UTF-8, after decompression if data was compressed.
+        """
+        decompressed_text = self.decompressed_text
+        if decompressed_text is not None:
+            return decompressed_text
+        def decode():
+            data = self.data
+            with self.timed('decoding'):
+                return data.decode('utf-8'), self.size
+
+        return self.decoded_view(name='text', compute=decode)
+
+    def text_chunks(self, chunk_size: int = 64 * 1024) -> Iterator[str]:
+        """
+        Payload decoded as UTF-8 (after decompression if data was compressed), in chunks of about `chunk_size`
+        characters, decompressed and decoded as they are consumed: the whole text is never held in memory.
+        """
+        data = self.data
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        if self.content_encoding not in ['deflate', 'gzip']:
+            for start in range(0, len(data), chunk_size):
+                yield decoder.decode(data[start:start + chunk_size])
+            yield decoder.decode(b'', final=True)
+            return
+
+        wbits = zlib.MAX_WBITS | 16 if self.content_encoding == 'gzip' else zlib.MAX_WBITS
+        decompressor = zlib.decompressobj(wbits=wbits)
+        pending = data
+        decompressed_size = 0
+        while pending:
+            chunk = decompressor.decompress(pending, chunk_size)
+            pending = decompressor.unconsumed_tail
+            if decompressor.eof and decompressor.unused_data:  # next member of a multi-member gzip payload
+                pending = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=wbits)
+            decompressed_size += len(chunk)
+            yield decoder.decode(chunk)
+        if not decompressor.eof:
+            raise zlib.error('Compressed data ended before the end-of-stream marker was reached')
+        self.decompressed_size = decompressed_size
+        yield decoder.decode(b'', final=True)
+
+    @property
+    def ndjson_events(self) -> [dict]:
+        """
+        Payload parsed as newline-delimited JSON.
+        """
+        def parse():
+            text = self.text
+            with self.timed('ndjson_parse', json_parse_seconds, 'ndjson'):
+                events = list(map(lambda e: json.loads(e), text.splitlines()))
+            return events, parsed_size_factor * len(text)
+
+        return self.decoded_view(name='ndjson_events', compute=parse)
+
+    @property
+    def multipart_files(self) -> dict:
+        """
+        Files sent in `multipart/form-data` payload, by field name (empty if payload is not multipart).
+        """
+        def parse():
+            mimetype, options = parse_options_header(self.content_type)
+            if mimetype != 'multipart/form-data':
+                return {}, 0
+            data = self.data
+            with self.timed('multipart_extraction'):
+                _, _, files = FormDataParser().parse(io.BytesIO(data), mimetype, self.size, options)
+                return {name: file.read() for name, file in files.items()}, self.size
+
+        return self.decoded_view(name='multipart_files', compute=parse)
+
+
+parsed_size_factor = 4  # approximate memory taken by parsed JSON, relative to the size of its text
+
+compact_storage = False
+decoded_views = DerivedViewCache(max_bytes=32 * 1024 * 1024)
+
+
+def configure_compact_storage(enabled: bool, max_bytes: int):
+    """
+    Enables compact storage mode for bodies recorded from now on, with `max_bytes` budget for their decoded views.
+    """
+    global compact_storage
+    compact_storage = enabled
+    decoded_views.clear()
+    decoded_views.max_bytes = max_bytes
@@ -6,14 +6,18 @@
 # Copyright 2019-2020 Datadog, Inc.
 # -----------------------------------------------------------
 
-import gzip
-import zlib
-import json
-from flask import Request
-from schemas.schema import Schema
+from collections import Counter
+from typing import Optional
+from schemas.derived_views import item_entry_size
+from schemas.request_body import RequestBody
+from schemas.schema import Schema, item_json
 from templates.components.card import Card, CardTab
+from templates.components.pagination import Pagination
 from templates.components.stat import Stat
-from validation.validation import validate_event
+from validation.validation import validate_events
+
+
+events_per_page = 50  # in inspector pages
 
 
 class RUMSchema(Schema):
@@ -24,47 +28,63 @@ class RUMSchema(Schema):
     request_template = 'rum/request.html'
 
     # RUM-specific:
-    stats = [Stat]
-    event_jsons: [dict]
-
-    def __init__(self, request: Request):
-        self.headers = list(map(lambda h: f'{h[0]}: {h[1]}', request.headers))
-        self.data_as_text = request.get_data(as_text=True)
-
-        content_encoding = request.headers.get('Content-Encoding', None)
-        if content_encoding == 'deflate':
-            self.decompressed_data = zlib.decompress(request.get_data()).decode('utf-8')
-        elif content_encoding == 'gzip':
-            self.decompressed_data = gzip.decompress(request.get_data()).decode('utf-8')
-        else:
-            self.decompressed_data = request.get_data().decode('utf-8')
-
-        self.event_jsons = list(map(lambda e: json.loads(e), self.decompressed_data.splitlines()))
-        self.stats = [
-            Stat(title='number of events', value=f'{len(self.event_jsons)}')
+    __slots__ = ('body', 'events_count', 'events_count_by_type')
+    body: RequestBody
+    events_count: int
+    events_count_by_type: dict  # RUM event type -> number of events
+
+    def __init__(self, body: RequestBody):
+        self.body = body
+        event_jsons = body.ndjson_events
+        self.events_count = len(event_jsons)
+        self.events_count_by_type = dict(Counter(f"{event.get('type')}" for event in event_jsons))
+
+    @property
+    def event_jsons(self) -> [dict]:
+        return self.body.ndjson_events
+
+    @property
+    def stats(self) -> [Stat]:
+        return [
+            Stat(title='number of events', value=f'{self.events_count}')
         ]
 
-    def body_views_card(self) -> Card:
+    def body_views_card(self, page: int = 1) -> Card:
         return Card(
             title='View as:',
             tabs=[
-                self.events_data(),
-                self.events_metadata(),
+                self.events_data(page=page),
+                self.events_metadata(page=page),
             ]
         )
 
-    def events_data(self) -> CardTab:
+    def events_data(self, page: int) -> CardTab:
+        """
+        One page of events, with their validation result. Event bodies are loaded on demand, with `items()`.
+        """
+        pagination = Pagination(page=page, per_page=events_per_page, total=self.events_count, anchor='events')
+        events = self.derived_view(name='events_data', compute=self._compute_events_data)['events']
+        obj = {
+            'events': events[pagination.offset:pagination.end],
+            'pagination': pagination,
+        }
+        return CardTab(title=f'Events ({self.events_count})', template='rum/events_view.html', object=obj,
+                       anchor='events')
+
+    def _compute_events_data(self) -> (dict, int):
+        event_jsons = self.event_jsons
         obj = {
             'events': [],
-            'dd_events': json.dumps(self.event_jsons),
         }
+        size = 0
 
-        for event in self.event_jsons:
-            vd = validate_event(
-                event=event,
+        with self.body.timed('validation: rum-events-format.json'):
+            validation_results = validate_events(
+                events=event_jsons,
                 schema_path='.schemas/rum-events-format.json'
             )
 
+        for event, vd in zip(event_jsons, validation_results):
             pills = []  # pills rendered below validation result
             if vd.all_ok:
                 pills = [
@@ -74,26 +94,48 @@ class RUMSchema(Schema):
                     f"application.id: {event['application']['id']}"
                 ]
 
-            obj['events'].append({
+            entry = {
                 'pills': pills,
-                'pretty_json': json.dumps(event, indent=4),
-                'rum_validation': vd
-            })
-
-        return CardTab(title=f'Events ({len(self.event_jsons)})', template='rum/events_view.html', object=obj)
+                'validation': vd
+            }
+            size += item_entry_size(entry)
+            obj['events'].append(entry)
+
+        return obj, size
+
+    def items(self, name: str, offset: int, limit: int) -> Optional[tuple]:
+        if name != 'events':
+            return None
+        event_jsons = self.event_jsons
+        events = self.derived_view(name='events_data', compute=self._compute_events_data)['events']
+        return len(event_jsons), [
+            item_json(index=index, json=event_jsons[index], pills=events[index]['pills'],
+                      validation=events[index]['validation'])
+            for index in range(offset, min(offset + limit, len(event_jsons)))
+        ]
 
     def as_json(self) -> dict:
         return {
-            "headers": self.headers,
-            "data": self.data_as_text,
-            "decompressed_data": self.decompressed_data
+            "headers": list(self.body.headers),
+            "data": self.body.data_as_text,
+            "decompressed_data": self.body.text
         }
 
-    def events_metadata(self) -> CardTab:
-        data = self.events_data()
-        data.title = 'Metadata'
-        data.template = 'rum/events_metadata.html'
-        return data
+    def events_metadata(self, page: int) -> CardTab:
+        pagination = Pagination(page=page, per_page=events_per_page, total=self.events_count, anchor='metadata')
+        events = self.derived_view(name='events_data', compute=self._compute_events_data)['events']
+        obj = {
+            'events': events[pagination.offset:pagination.end],
+            'pagination': pagination,
+        }
+        return CardTab(title='Metadata', template='rum/events_metadata.html', object=obj, anchor='metadata')
+
+    def summary(self, validate: bool) -> dict:
+        summary = {'events': dict(self.events_count_by_type)}
+        if validate:
+            events = self.derived_view(name='events_data', compute=self._compute_events_data)['events']
+            summary['invalid_events'] = sum(1 for e in events if not e['validation'].all_ok)
+        return summary
 
     @staticmethod
     def matches(method: str, path: str):
@@ -6,14 +6,61 @@
 # Copyright 2019-2020 Datadog, Inc.
 # -----------------------------------------------------------
 
+from typing import Callable, Optional
+from schemas.derived_views import derived_views, owner_keys
+
 
 class Schema:
+    __slots__ = ('_owner_key',)
+
     name: str  # displayed in the UI
     pretty_name: str
     is_known: bool
     endpoint_template: str
     request_template: str
+    # Errors raised by the constructor for payloads it can't parse: such requests are shown without this schema
+    parse_errors: tuple = ()
 
     @staticmethod
     def matches(method: str, path: str):
         pass
+
+    def summary(self, validate: bool) -> dict:
+        """
+        Compact, JSON-serializable summary of the request seen through this schema (e.g. number of events).
+        """
+        return {}
+
+    def items(self, name: str, offset: int, limit: int) -> Optional[tuple]:
+        """
+        Items named `name` (e.g. RUM events) in `[offset, offset + limit)` range, with their validation result,
+        as `(total number of items, [item JSON])` (see `item_json()`), or `None` if this schema has no such items.
+        Served by `/inspect_api`, so inspector pages load item bodies on demand.
+        """
+        return None
+
+    def derived_view(self, name: str, compute: Callable[[], tuple]):
+        """
+        Returns the view named `name`, computed once with `compute()` and then kept in `derived_views` cache.
+        `compute()` must return `(view, size in bytes)`.
+        """
+        if (owner_key := getattr(self, '_owner_key', None)) is None:
+            owner_key = self._owner_key = next(owner_keys)
+        return derived_views.get(owner_key=owner_key, name=name, compute=compute)
+
+
+def item_json(index: int, json: dict, pills: [str], validation) -> dict:
+    """
+    JSON representation of an item returned by `Schema.items()`, with its `JSONSchemaValidationResult`
+    (`None` for items that are not validated, e.g. logs).
+    """
+    return {
+        "index": index,
+        "json": json,
+        "pills": pills,
+        "validation": None if validation is None else {
+            "schema_name": validation.schema_name,
+            "all_ok": validation.all_ok,
+            "error": validation.error,
+        },
+    }
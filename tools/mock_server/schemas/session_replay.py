@@ -6,15 +6,23 @@
 # Copyright 2019-2020 Datadog, Inc.
 # -----------------------------------------------------------
 
+import os
 import zlib
 import json
-from flask import Request
-from schemas.schema import Schema
+from collections import Counter
+from typing import Optional
+from schemas.derived_views import item_entry_size
+from schemas.request_body import RequestBody, parsed_size_factor
+from schemas.schema import Schema, item_json
 from templates.components.card import Card, CardTab
+from templates.components.pagination import Pagination
 from templates.components.stat import Stat
-from validation.validation import validate_event
+from validation.validation import validate_event, validate_events
+from metrics import decompression_seconds, json_parse_seconds
 
 
+records_per_page = 50  # in inspector pages
+
 record_name_by_type = {
     4: 'meta',
     6: 'focus',
@@ -33,39 +41,95 @@ class SRSchema(Schema):
     request_template = 'session-replay/request.html'
 
     # SR-specific
-    stats = [Stat]
-    segment_json: dict
-
-    def __init__(self, request: Request):
-        segment_file = request.files['segment'].read()
-        segment_json_string = zlib.decompress(segment_file).decode('utf-8')
-        self.segment_json = json.loads(segment_json_string)
-        self.stats = SRSchema.create_stats(records=self.segment_json['records'])
-
-    def body_views_card(self) -> Card:
+    __slots__ = ('body', 'records_count_by_type')
+    body: RequestBody
+    records_count_by_type: dict  # record type -> number of records
+
+    def __init__(self, body: RequestBody):
+        self.body = body
+        self.records_count_by_type = dict(Counter(r['type'] for r in self.segment_json['records']))
+
+    @property
+    def segment_json(self) -> dict:
+        def parse():
+            segment = self.body.multipart_files['segment']
+            with self.body.timed('segment_decompression', decompression_seconds, 'deflate'):
+                segment_json_string = zlib.decompress(segment).decode('utf-8')
+            with self.body.timed('segment_parse', json_parse_seconds, 'segment'):
+                segment_json = json.loads(segment_json_string)
+            return segment_json, parsed_size_factor * len(segment_json_string)
+
+        return self.body.decoded_view(name='segment_json', compute=parse)
+
+    @property
+    def records_count(self) -> int:
+        return sum(self.records_count_by_type.values())
+
+    @property
+    def stats(self) -> [Stat]:
+        return SRSchema.create_stats(records_count_by_type=self.records_count_by_type)
+
+    def body_views_card(self, page: int = 1) -> Card:
         return Card(
             title='View as:',
             tabs=[
                 self.segment_data(),
-                self.records_data(),
+                self.records_data(page=page),
             ]
         )
 
     def segment_data(self) -> CardTab:
-        vd = validate_event(
-            event=self.segment_json,
-            schema_path='.schemas/session-replay-mobile-format.json'
-        )
+        """
+        Segment with its validation result. Records are left out (they are listed in the "Records" tab).
+        """
+        obj = self.derived_view(name='segment_data', compute=self._compute_segment_data)
+        return CardTab(title='Segment', template='session-replay/segment_view.html', object=obj)
 
+    def _compute_segment_data(self) -> (dict, int):
+        segment_json = self.segment_json
+        with self.body.timed('validation: session-replay-mobile-format.json'):
+            vd = validate_event(
+                event=segment_json,
+                schema_path='.schemas/session-replay-mobile-format.json'
+            )
+
+        segment_without_records = {key: value for key, value in segment_json.items() if key != 'records'}
+        segment_without_records['records'] = f'({len(segment_json.get("records", []))} records)'
         obj = {
-            'pretty_json': json.dumps(self.segment_json, indent=4),
+            'pretty_json': json.dumps(segment_without_records, indent=4),
             'sr_validation': vd,
-            'dd_segment': json.dumps(self.segment_json),  # for integration with JS console
         }
 
-        return CardTab(title='Segment', template='session-replay/segment_view.html', object=obj)
+        return obj, len(obj['pretty_json']) + len(vd.error or '')
 
-    def records_data(self) -> CardTab:
+    def records_data(self, page: int) -> CardTab:
+        """
+        One page of records, with their validation result. Record bodies are loaded on demand, with `items()`.
+        """
+        pagination = Pagination(page=page, per_page=records_per_page, total=self.records_count, anchor='records')
+        records = self.derived_view(name='records_data', compute=self._compute_records_data)['records']
+        obj = {
+            'records': records[pagination.offset:pagination.end],
+            'pagination': pagination,
+        }
+        return CardTab(title=f'Records ({self.records_count})', template='session-replay/records_view.html',
+                       object=obj, anchor='records')
+
+    def items(self, name: str, offset: int, limit: int) -> Optional[tuple]:
+        if name == 'segment':
+            vd = self.derived_view(name='segment_data', compute=self._compute_segment_data)['sr_validation']
+            return 1, [item_json(index=0, json=self.segment_json, pills=[], validation=vd)][offset:offset + limit]
+        if name != 'records':
+            return None
+        record_jsons = self.segment_json['records']
+        records = self.derived_view(name='records_data', compute=self._compute_records_data)['records']
+        return len(record_jsons), [
+            item_json(index=index, json=record_jsons[index], pills=records[index]['pills'],
+                      validation=records[index]['validation'])
+            for index in range(offset, min(offset + limit, len(record_jsons)))
+        ]
+
+    def _compute_records_data(self) -> (dict, int):
         record_schema_path_by_type = {
             4: '.schemas/schemas/session-replay/common/meta-record-schema.json',
             6: '.schemas/schemas/session-replay/common/focus-record-schema.json',
@@ -75,43 +139,57 @@ class SRSchema(Schema):
             11: '.schemas/schemas/schemas/session-replay/mobile/incremental-snapshot-record-schema.json',
         }
 
+        records = self.segment_json['records']
         obj = {
             'records': [],
-            'dd_records': json.dumps(self.segment_json['records']),  # for integration with JS console
         }
-
-        for record in self.segment_json['records']:
-            vd = validate_event(
-                event=record,
-                schema_path=record_schema_path_by_type[record['type']]
-            )
-
+        size = 0
+
+        # Validate records in batches, one per schema:
+        validation_results = [None] * len(records)
+        indexes_by_schema_path = {}
+        for index, record in enumerate(records):
+            indexes_by_schema_path.setdefault(record_schema_path_by_type[record['type']], []).append(index)
+        for schema_path, indexes in indexes_by_schema_path.items():
+            with self.body.timed(f'validation: {os.path.basename(schema_path)}'):
+                results = validate_events(events=[records[i] for i in indexes], schema_path=schema_path)
+            for index, vd in zip(indexes, results):
+                validation_results[index] = vd
+
+        for record, vd in zip(records, validation_results):
             pills = [
                 f"{record_name_by_type[record['type']]}"
             ]
 
-            obj['records'].append({
+            entry = {
                 'pills': pills,
-                'pretty_json': json.dumps(record, indent=4),
-                'sr_validation': vd,
-            })
-
-        records_count = len(self.segment_json['records'])
-        return CardTab(title=f'Records ({records_count})', template='session-replay/records_view.html', object=obj)
+                'validation': vd,
+            }
+            size += item_entry_size(entry)
+            obj['records'].append(entry)
+
+        return obj, size
+
+    def summary(self, validate: bool) -> dict:
+        summary = {'records': {
+            record_name_by_type.get(r_type, f'{r_type}'): count for r_type, count in self.records_count_by_type.items()
+        }}
+        if validate:
+            records_data = self.derived_view(name='records_data', compute=self._compute_records_data)
+            segment_data = self.derived_view(name='segment_data', compute=self._compute_segment_data)
+            summary['invalid_records'] = sum(1 for r in records_data['records'] if not r['validation'].all_ok)
+            summary['valid_segment'] = segment_data['sr_validation'].all_ok
+        return summary
 
     @staticmethod
     def matches(method: str, path: str):
         return method == 'POST' and path.startswith('/api/v2/replay')
 
     @staticmethod
-    def create_stats(records: dict) -> [Stat]:
+    def create_stats(records_count_by_type: dict) -> [Stat]:
         stats: [Stat] = []
         for r_type in record_name_by_type:
-            count = 0
-
-            for record in records:
-                if record['type'] == r_type:
-                    count += 1
+            count = records_count_by_type.get(r_type, 0)
 
             stat = Stat(title=f'"{record_name_by_type[r_type]}" records', value=f'{count}')
             stats.append(stat)
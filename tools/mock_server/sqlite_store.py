@@ -0,0 +1,510 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from flask import url_for
+from aggregates import aggregates_json, validation_counts_or_none
+from event_index import EventQuery, indexed_events
+from request_store import RequestStore, endpoint_hash
+from retention import RetentionPolicy
+
+schema_sql = '''
+CREATE TABLE IF NOT EXISTS endpoints (
+    id INTEGER PRIMARY KEY,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    hash TEXT NOT NULL UNIQUE,
+    evicted_requests INTEGER NOT NULL DEFAULT 0,
+    evicted_bytes INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (method, path)
+);
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reused, so IDs stay monotonic after evictions and resets
+    endpoint_id INTEGER NOT NULL REFERENCES endpoints (id),
+    date TEXT NOT NULL,  -- ISO 8601, local time
+    query_string TEXT NOT NULL,
+    content_type TEXT,
+    content_length INTEGER,
+    headers TEXT NOT NULL,  -- JSON array of 'field: value'
+    size INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS requests_by_endpoint ON requests (endpoint_id, id);
+CREATE INDEX IF NOT EXISTS requests_by_date ON requests (date);
+CREATE TABLE IF NOT EXISTS events (  -- RUM events of stored requests (see `indexed_events()`)
+    request_id INTEGER NOT NULL REFERENCES requests (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,  -- position of the event in its request
+    date REAL,  -- event `date`, in milliseconds since epoch
+    type TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    view_id TEXT NOT NULL,
+    application_id TEXT NOT NULL,
+    PRIMARY KEY (request_id, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_by_type ON events (type, date);
+CREATE INDEX IF NOT EXISTS events_by_session ON events (session_id, date);
+CREATE INDEX IF NOT EXISTS events_by_view ON events (view_id, date);
+CREATE INDEX IF NOT EXISTS events_by_application ON events (application_id, date);
+CREATE INDEX IF NOT EXISTS events_by_date ON events (date);
+CREATE TABLE IF NOT EXISTS request_counts (  -- contribution of each stored request to `aggregates`
+    request_id INTEGER NOT NULL REFERENCES requests (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (request_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS aggregates (  -- running totals of `request_counts`, by endpoint (see `Aggregates`)
+    endpoint_id INTEGER NOT NULL REFERENCES endpoints (id),
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (endpoint_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('evicted_requests', 0), ('evicted_bytes', 0), ('resets', 0),
+    ('validation_counted_id', 0);  -- requests up to this ID were taken by `count_validation()` of some process
+'''
+
+request_columns = 'r.id, e.method, e.path, r.date, r.query_string, r.content_type, r.content_length, r.headers, ' \
+                  'r.size, r.body'
+
+event_columns = {  # event attribute (in order of `event_attributes`) -> column of `events` table
+    'type': 'type',
+    'session.id': 'session_id',
+    'view.id': 'view_id',
+    'application.id': 'application_id',
+}
+
+
+class SQLiteAggregates:
+    """
+    Running totals of stored requests of one endpoint (or all endpoints if `endpoint_id` is `None`),
+    read from the `aggregates` table, with the interface of `Aggregates`.
+    """
+    def __init__(self, store: 'SQLiteRequestStore', endpoint_id: Optional[int]):
+        self._store = store
+        self._endpoint_id = endpoint_id
+
+    def value(self, name: str) -> int:
+        if self._endpoint_id is None:
+            return self._store.query_value('SELECT COALESCE(SUM(value), 0) FROM aggregates WHERE name = ?', (name,))
+        return self._store.query_value('SELECT COALESCE(SUM(value), 0) FROM aggregates '
+                                       'WHERE endpoint_id = ? AND name = ?', (self._endpoint_id, name))
+
+    def as_json(self) -> dict:
+        if self._endpoint_id is None:
+            rows = self._store.query_rows('SELECT name, SUM(value) FROM aggregates GROUP BY name', ())
+        else:
+            rows = self._store.query_rows('SELECT name, value FROM aggregates WHERE endpoint_id = ?',
+                                          (self._endpoint_id,))
+        return aggregates_json(dict(rows))
+
+
+class SQLiteRequestRef:
+    """
+    Request recorded by any process, sent to `on_event` without reading its body: it is loaded with `load()`,
+    only by listeners interested in it.
+    """
+    __slots__ = ('id', 'method', 'path', '_store')
+
+    id: int
+    method: str
+    path: str
+
+    def __init__(self, store: 'SQLiteRequestStore', id: int, method: str, path: str):
+        self._store = store
+        self.id = id
+        self.method = method
+        self.path = path
+
+    def load(self):
+        """
+        Returns the request, or `None` if it was evicted meanwhile.
+        """
+        requests = self._store.query_requests('r.id = ?', (self.id,))
+        return requests[0] if requests else None
+
+
+class SQLiteEndpoint:
+    """
+    Endpoint of `SQLiteRequestStore`. Requests are queried from the database on each access.
+    """
+    method: str
+    path: str
+    schemas: [type]  # schema classes matching this endpoint (only their class attributes are used by templates)
+    evicted_requests: int
+    evicted_bytes: int
+    aggregates: SQLiteAggregates  # of stored requests
+
+    def __init__(self, store: 'SQLiteRequestStore', id: int, method: str, path: str, hash: str,
+                 evicted_requests: int, evicted_bytes: int):
+        self._store = store
+        self._id = id
+        self._hash = hash  # as stored in the `endpoints` table, so it is not computed again for each link
+        self.method = method
+        self.path = path
+        self.schemas = [cls for cls in store.schema_classes if cls.matches(method, path)]
+        self.evicted_requests = evicted_requests
+        self.evicted_bytes = evicted_bytes
+        self.aggregates = SQLiteAggregates(store=store, endpoint_id=id)
+
+    @property
+    def requests(self) -> list:
+        return self._store.query_requests('r.endpoint_id = ?', (self._id,))
+
+    def name(self):
+        return f'{self.method} {self.path}'
+
+    def request_with_id(self, id: int):
+        requests = self._store.query_requests('r.endpoint_id = ? AND r.id = ?', (self._id, id))
+        return requests[0] if requests else None
+
+    def requests_page(self, offset: int, limit: int) -> list:
+        return self._store.query_requests('r.endpoint_id = ?', (self._id,), limit=limit, offset=offset)
+
+    def requests_in_range(self, after_id: int, until_id: int) -> list:
+        return self._store.query_requests('r.endpoint_id = ? AND r.id > ? AND r.id <= ?',
+                                          (self._id, after_id, until_id))
+
+    def requests_count(self) -> int:
+        return self.aggregates.value('requests')
+
+    def bytes_received(self) -> int:
+        return self.aggregates.value('bytes')
+
+    def follow_url(self, schema):
+        return url_for('inspect_endpoint', schema_name=schema.name, endpoint_hash=self.hash())
+
+    def hash(self) -> str:
+        return self._hash
+
+    def schema_with_name(self, name: str):
+        return next((s for s in self.schemas if s.name == name), None)
+
+
+class SQLiteRequestStore(RequestStore):
+    """
+    Requests stored in a SQLite database (in WAL mode), so several server processes can share them
+    and they can be queried after the run. Each thread uses its own connection.
+
+    Requests recorded by any process are picked up by a polling thread in each process and sent to `on_event`.
+    """
+    path: str
+    schema_classes: [type]
+    poll_interval: float  # seconds between checks for requests recorded by other processes
+
+    def __init__(self, path: str, make_request: Callable[[int, dict, bytes], object], schema_classes: [type],
+                 retention: Optional[RetentionPolicy] = None):
+        """
+        `make_request(id, metadata, data)` creates the request object returned to routes
+        (see `GenericRequest.from_metadata()`).
+        """
+        self.path = path
+        self.schema_classes = schema_classes
+        self.retention = retention or RetentionPolicy()
+        self.on_event = None
+        self.has_listeners = None
+        self.poll_interval = 0.05
+        self._make_request = make_request
+        self._connections = threading.local()
+        self._recent_requests = OrderedDict()  # id -> request, so their derived views are reused between renders
+        self._recent_requests_lock = threading.Lock()
+        self.aggregates = SQLiteAggregates(store=self, endpoint_id=None)  # of stored requests, on all endpoints
+        with sqlite3.connect(self.path) as db:  # not kept: connections must not be shared with forked processes
+            db.executescript(schema_sql)
+        db.close()
+
+    @property
+    def last_request_id(self) -> int:
+        return self.query_value("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'requests'")
+
+    @property
+    def evicted_requests(self) -> int:
+        return self.query_value("SELECT value FROM counters WHERE name = 'evicted_requests'")
+
+    @property
+    def evicted_bytes(self) -> int:
+        return self.query_value("SELECT value FROM counters WHERE name = 'evicted_bytes'")
+
+    def __iter__(self) -> Iterator[SQLiteEndpoint]:
+        return iter(self._query_endpoints('1', ()))
+
+    def endpoint(self, method: str, path: str) -> Optional[SQLiteEndpoint]:
+        return next(iter(self._query_endpoints('method = ? AND path = ?', (method, path))), None)
+
+    def endpoint_with_hash(self, hash: str) -> Optional[SQLiteEndpoint]:
+        return next(iter(self._query_endpoints('hash = ?', (hash,))), None)
+
+    def record(self, request) -> bool:
+        counts = request.counts  # computed before starting the transaction, as it parses the payload
+        db = self._connection()
+        with self._transaction(db):
+            cursor = db.execute('INSERT OR IGNORE INTO endpoints (method, path, hash) VALUES (?, ?, ?)',
+                                (request.method, request.path, endpoint_hash(method=request.method, path=request.path)))
+            is_new_endpoint = cursor.rowcount > 0
+            endpoint_id = self.query_value('SELECT id FROM endpoints WHERE method = ? AND path = ?',
+                                           (request.method, request.path))
+            cursor = db.execute(
+                'INSERT INTO requests (endpoint_id, date, query_string, content_type, content_length, headers, size, '
+                'body) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (endpoint_id, request.date.isoformat(timespec='microseconds'), request.query_string,
+                 request.content_type, request.content_length, json.dumps(list(request.body.headers)), request.size,
+                 request.body.data)
+            )
+            request.id = cursor.lastrowid
+            db.executemany(
+                f'INSERT INTO events (request_id, idx, date, {", ".join(event_columns.values())}) '
+                f'VALUES (?, ?, ?, {", ".join("?" for _ in event_columns)})',
+                [(request.id, index, date) + values for index, date, values in indexed_events(request)]
+            )
+            db.executemany('INSERT INTO request_counts (request_id, name, value) VALUES (?, ?, ?)',
+                           [(request.id, name, value) for name, value in counts.items()])
+            db.executemany('INSERT INTO aggregates (endpoint_id, name, value) VALUES (?, ?, ?) '
+                           'ON CONFLICT (endpoint_id, name) DO UPDATE SET value = value + excluded.value',
+                           [(endpoint_id, name, value) for name, value in counts.items()])
+            self._enforce_endpoint_retention(db, endpoint_id)
+            self._enforce_retention(db)
+        return is_new_endpoint
+
+    def count_validation(self):
+        db = self._connection()
+        with self._transaction(db):  # takes requests recorded since the last call, in any process
+            after_id = self.query_value("SELECT value FROM counters WHERE name = 'validation_counted_id'")
+            until_id = self.last_request_id
+            db.execute("UPDATE counters SET value = ? WHERE name = 'validation_counted_id'", (until_id,))
+        while requests := self.query_requests(
+                "r.id > ? AND r.id <= ? AND NOT EXISTS (SELECT 1 FROM request_counts c "
+                "WHERE c.request_id = r.id AND c.name = 'validation/passed')", (after_id, until_id), limit=100):
+            after_id = requests[-1].id
+            # Validated outside the transaction, so other processes are not blocked meanwhile:
+            counted = [(request.id, validation_counts_or_none(request)) for request in requests]
+            with self._transaction(db):
+                for request_id, counts in counted:
+                    if counts is None:
+                        continue
+                    if (endpoint_id := self.query_value('SELECT endpoint_id FROM requests WHERE id = ?',
+                                                        (request_id,))) is None:
+                        continue  # evicted
+                    db.executemany('INSERT INTO request_counts (request_id, name, value) VALUES (?, ?, ?)',
+                                   [(request_id, name, value) for name, value in counts.items()])
+                    db.executemany('INSERT INTO aggregates (endpoint_id, name, value) VALUES (?, ?, ?) '
+                                   'ON CONFLICT (endpoint_id, name) DO UPDATE SET value = value + excluded.value',
+                                   [(endpoint_id, name, value) for name, value in counts.items()])
+
+    def query_events(self, query: EventQuery) -> (int, list):
+        conditions = [f'{event_columns[name]} = ?' for name in query.filters]
+        parameters = tuple(query.filters.values())
+        if query.date_from is not None:
+            conditions.append('date >= ?')
+            parameters += (query.date_from,)
+        if query.date_to is not None:
+            conditions.append('date < ?')
+            parameters += (query.date_to,)
+        where = ' AND '.join(conditions) or '1'
+        order = ' DESC' if query.descending else ''
+        db = self._connection()
+        total = self.query_value(f'SELECT COUNT(*) FROM events WHERE {where}', parameters)
+        rows = db.execute(
+            f'SELECT request_id, idx FROM events WHERE {where} '
+            f'ORDER BY date{order}, request_id{order}, idx{order} LIMIT ? OFFSET ?',  # NULL dates first, as in `EventIndex`
+            parameters + (query.limit, query.offset)
+        ).fetchall()
+        if not rows:
+            return total, []
+        requests = {r.id: r for r in self.query_requests(f'r.id IN ({", ".join("?" for _ in rows)})',
+                                                         tuple(request_id for request_id, _ in rows))}
+        return total, [(requests[request_id], index) for request_id, index in rows if request_id in requests]
+
+    def wait_for_requests(self, after_id: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.last_request_id <= after_id:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def enforce_retention(self):
+        if self.retention.max_age is not None:
+            db = self._connection()
+            with self._transaction(db):
+                self._enforce_retention(db)
+
+    def clear(self):
+        db = self._connection()
+        with self._transaction(db):
+            db.execute('DELETE FROM requests')
+            db.execute('DELETE FROM aggregates')
+            db.execute('UPDATE endpoints SET evicted_requests = 0, evicted_bytes = 0')
+            db.execute("UPDATE counters SET value = CASE name WHEN 'resets' THEN value + 1 ELSE 0 END")
+
+    def start(self):
+        threading.Thread(target=self._follow_requests, name='sqlite-follower', daemon=True).start()
+        threading.Thread(target=self._count_validation_forever, name='validation-counter', daemon=True).start()
+
+    def _count_validation_forever(self):
+        while True:
+            time.sleep(self.poll_interval)
+            counted_id = self.query_value("SELECT value FROM counters WHERE name = 'validation_counted_id'")
+            if self.last_request_id > counted_id:  # checked without a write transaction, as all processes poll
+                self.count_validation()
+
+    def query_value(self, sql: str, parameters: tuple = ()):
+        row = self._connection().execute(sql, parameters).fetchone()
+        return row[0] if row else None
+
+    def query_rows(self, sql: str, parameters: tuple = ()) -> list:
+        return self._connection().execute(sql, parameters).fetchall()
+
+    def query_requests(self, where: str, parameters: tuple, limit: int = -1, offset: int = 0) -> list:
+        """
+        Requests matching the `where` clause (on `requests r` joined with `endpoints e`), oldest first.
+        """
+        rows = self._connection().execute(
+            f'SELECT {request_columns} FROM requests r JOIN endpoints e ON e.id = r.endpoint_id '
+            f'WHERE {where} ORDER BY r.id LIMIT ? OFFSET ?', parameters + (limit, offset)
+        ).fetchall()
+        return [self._request_from_row(row) for row in rows]
+
+    def _request_from_row(self, row: tuple):
+        id, method, path, date, query_string, content_type, content_length, headers, size, body = row
+        with self._recent_requests_lock:
+            if (request := self._recent_requests.get(id)) is not None:
+                self._recent_requests.move_to_end(id)
+                return request
+        metadata = {
+            "method": method,
+            "path": path,
+            "query_string": query_string,
+            "date": date,
+            "content_type": content_type,
+            "content_length": content_length,
+            "headers": json.loads(headers),
+            "size": size,
+        }
+        request = self._make_request(id, metadata, body)
+        with self._recent_requests_lock:
+            self._recent_requests[id] = request
+            while len(self._recent_requests) > 256:
+                self._recent_requests.popitem(last=False)
+        return request
+
+    def _query_endpoints(self, where: str, parameters: tuple) -> [SQLiteEndpoint]:
+        rows = self._connection().execute(
+            f'SELECT id, method, path, hash, evicted_requests, evicted_bytes FROM endpoints WHERE {where} ORDER BY id',
+            parameters
+        ).fetchall()
+        return [SQLiteEndpoint(store=self, id=id, method=method, path=path, hash=hash,
+                               evicted_requests=evicted_requests, evicted_bytes=evicted_bytes)
+                for id, method, path, hash, evicted_requests, evicted_bytes in rows]
+
+    def _enforce_endpoint_retention(self, db: sqlite3.Connection, endpoint_id: int):
+        policy = self.retention
+        newest = 'id < (SELECT MAX(id) FROM requests WHERE endpoint_id = :endpoint)'  # most recent request is kept
+        if policy.max_requests_per_endpoint is not None:
+            self._evict(db, f'endpoint_id = :endpoint AND {newest} AND id <= (SELECT id FROM requests '
+                            f'WHERE endpoint_id = :endpoint ORDER BY id DESC LIMIT 1 OFFSET :limit)',
+                        {'endpoint': endpoint_id, 'limit': policy.max_requests_per_endpoint})
+        if policy.max_bytes_per_endpoint is not None:
+            self._evict(db, f'endpoint_id = :endpoint AND {newest} AND id <= (SELECT MAX(id) FROM ('
+                            f'SELECT id, SUM(size) OVER (ORDER BY id DESC) AS total FROM requests '
+                            f'WHERE endpoint_id = :endpoint) WHERE total > :limit)',
+                        {'endpoint': endpoint_id, 'limit': policy.max_bytes_per_endpoint})
+
+    def _enforce_retention(self, db: sqlite3.Connection):
+        policy = self.retention
+        newest = 'id < (SELECT MAX(id) FROM requests)'  # most recent request is kept
+        if policy.max_requests is not None:
+            self._evict(db, f'{newest} AND id <= (SELECT id FROM requests ORDER BY id DESC LIMIT 1 OFFSET :limit)',
+                        {'limit': policy.max_requests})
+        if policy.max_bytes is not None:
+            self._evict(db, f'{newest} AND id <= (SELECT MAX(id) FROM ('
+                            f'SELECT id, SUM(size) OVER (ORDER BY id DESC) AS total FROM requests) '
+                            f'WHERE total > :limit)',
+                        {'limit': policy.max_bytes})
+        if policy.max_age is not None:
+            oldest_date = datetime.datetime.now() - datetime.timedelta(seconds=policy.max_age)
+            self._evict(db, f'{newest} AND date < :date', {'date': oldest_date.isoformat(timespec='microseconds')})
+
+    def _evict(self, db: sqlite3.Connection, where: str, parameters: dict):
+        evicted = db.execute(
+            f'SELECT endpoint_id, COUNT(*), SUM(size) FROM requests WHERE {where} GROUP BY endpoint_id', parameters
+        ).fetchall()
+        if not evicted:
+            return
+        for endpoint_id, count, size in evicted:
+            db.execute('UPDATE endpoints SET evicted_requests = evicted_requests + ?, '
+                       'evicted_bytes = evicted_bytes + ? WHERE id = ?', (count, size, endpoint_id))
+        db.execute("UPDATE counters SET value = value + ? WHERE name = 'evicted_requests'",
+                   (sum(count for _, count, _ in evicted),))
+        db.execute("UPDATE counters SET value = value + ? WHERE name = 'evicted_bytes'",
+                   (sum(size for _, _, size in evicted),))
+        db.execute(f'INSERT INTO aggregates (endpoint_id, name, value) '
+                   f'SELECT r.endpoint_id, c.name, -SUM(c.value) FROM request_counts c JOIN requests r '
+                   f'ON r.id = c.request_id WHERE c.request_id IN (SELECT id FROM requests WHERE {where}) '
+                   f'GROUP BY r.endpoint_id, c.name '
+                   f'ON CONFLICT (endpoint_id, name) DO UPDATE SET value = value + excluded.value', parameters)
+        db.execute(f'DELETE FROM requests WHERE {where}', parameters)
+
+    def _follow_requests(self):
+        """
+        Sends references to requests recorded by all processes (and resets) to `on_event`, while it has listeners.
+        """
+        def current_resets() -> int:
+            return self.query_value("SELECT value FROM counters WHERE name = 'resets'")
+
+        # `None` while not followed, then only what is recorded (and reset) from then on is sent:
+        last_id, resets = (self.last_request_id, current_resets()) if self.is_followed() else (None, None)
+        while True:
+            time.sleep(self.poll_interval)
+            if not self.is_followed():
+                last_id, resets = None, None
+                continue
+            if last_id is None:
+                last_id, resets = self.last_request_id, current_resets()
+                continue
+            if (current := current_resets()) != resets:
+                resets = current
+                self._emit(('reset', None))
+            rows = self.query_rows('SELECT r.id, e.method, e.path FROM requests r JOIN endpoints e '
+                                   'ON e.id = r.endpoint_id WHERE r.id > ? ORDER BY r.id', (last_id,))
+            for id, method, path in rows:
+                last_id = id
+                self._emit(('request', SQLiteRequestRef(store=self, id=id, method=method, path=path)))
+
+    def _connection(self) -> sqlite3.Connection:
+        if (db := getattr(self._connections, 'db', None)) is None:
+            db = self._connections.db = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                                        check_same_thread=False)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            db.execute('PRAGMA foreign_keys = ON')  # so events are deleted with their request
+        return db
+
+    @staticmethod
+    @contextmanager
+    def _transaction(db: sqlite3.Connection):
+        """
+        `BEGIN IMMEDIATE` ... `COMMIT` (or `ROLLBACK` on error), so concurrent writers wait for each other
+        instead of failing to upgrade their lock.
+        """
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
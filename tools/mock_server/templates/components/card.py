@@ -6,6 +6,7 @@
 # Copyright 2019-2020 Datadog, Inc.
 # -----------------------------------------------------------
 
+from typing import Optional
 from uuid import uuid4
 
 
@@ -13,11 +14,13 @@ class CardTab:
     title: str
     template: str
     object: any  # ambiguous object, specific to `template`
+    anchor: Optional[str]  # if set, the tab is shown when the page URL ends with `#<anchor>`
 
-    def __init__(self, title: str, template: str, object: any):
+    def __init__(self, title: str, template: str, object: any, anchor: Optional[str] = None):
         self.title = title
         self.template = template
         self.object = object
+        self.anchor = anchor
 
 
 class Card:
@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+from typing import Optional
+
+
+class Pagination:
+    """
+    One page of a list rendered by the inspector. Other pages are linked with `?page=<number>`.
+    """
+    page: int  # 1-based, within existing pages
+    pages: int
+    per_page: int
+    total: int  # number of items in the list
+    anchor: Optional[str]  # tab shown when following page links (see `CardTab.anchor`)
+
+    def __init__(self, page: int, per_page: int, total: int, anchor: Optional[str] = None):
+        self.per_page = per_page
+        self.total = total
+        self.pages = max(1, -(-total // per_page))
+        self.page = min(max(1, page), self.pages)
+        self.anchor = anchor
+
+    @property
+    def offset(self) -> int:
+        return (self.page - 1) * self.per_page
+
+    @property
+    def end(self) -> int:
+        return min(self.offset + self.per_page, self.total)
+
+    def url(self, page: int) -> str:
+        return f'?page={page}' + (f'#{self.anchor}' if self.anchor else '')
+
+    def page_numbers(self) -> [Optional[int]]:
+        """
+        Pages linked from this page: first, last and neighbours of the current one (`None` for gaps).
+        """
+        shown = sorted({1, self.pages} | set(range(max(1, self.page - 2), min(self.pages, self.page + 2) + 1)))
+        numbers = []
+        for page in shown:
+            if numbers and page > numbers[-1] + 1:
+                numbers.append(None)
+            numbers.append(page)
+        return numbers
@@ -8,8 +8,18 @@
 
 import os
 import json
-from jsonschema import RefResolver, validate, ValidationError
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urljoin
+from jsonschema import RefResolver, ValidationError
+from jsonschema.exceptions import RefResolutionError, best_match
+from jsonschema.validators import validator_for
 from typing import Optional
+from metrics import validation_seconds, validated_events, validation_failures, validator_cache_lookups, \
+    validator_cache_invalidations
 
 
 class JSONSchemaValidationResult:
@@ -23,7 +33,7 @@ class JSONSchemaValidationResult:
         self.error = error
 
 
-def patch_ajv_uri(uri):
+def patched_ajv_file_path(uri) -> str:
     """
     For patching $ref and $ids after AJV-required
     change introduced in https://github.com/DataDog/rum-events-format/pull/88
@@ -52,18 +62,145 @@ def patch_ajv_uri(uri):
                 file_url = file_url.replace(pattern, fix)
                 hit = True
 
-    try:
-        return json.load(open(file_url, 'r'))
-    except Exception as error:
-        raise error
+    return file_url
+
+
+class CompiledValidator:
+    """
+    JSON schema validator with all `$ref`s resolved up front, so validating an event
+    does not touch the disk. Remembers the files it was built from, to detect changes.
+
+    `RefResolver` keeps its resolution scope in mutable state, so each thread validates with its own
+    resolver and validator, created on first use from the documents resolved up front.
+    """
+    schema_path: str
+    file_mtimes: dict  # path -> modification time of each file this validator was built from
+
+    def __init__(self, schema_path: str):
+        self.schema_path = schema_path
+        self.file_mtimes = {}
+        self._schema = self._load(schema_path)
+        self._base_uri = 'file://' + os.path.abspath(os.path.dirname(schema_path)) + '/'
+        self._cls = validator_for(self._schema)
+        self._cls.check_schema(self._schema)
+        resolver = self._new_resolver(store={})
+        self._resolve_refs(self._schema, resolver=resolver, visited=set())
+        self._store = dict(resolver.store)  # URL -> resolved document, shared (read-only) by all threads
+        self._local = threading.local()  # `validator` of each thread
+
+    def validate(self, event: dict) -> Optional[ValidationError]:
+        """
+        Returns the most relevant validation error or `None` if `event` matches the schema.
+        """
+        if (validator := getattr(self._local, 'validator', None)) is None:
+            validator = self._local.validator = self._cls(self._schema, resolver=self._new_resolver(store=self._store))
+        return best_match(validator.iter_errors(event))
+
+    def _new_resolver(self, store: dict) -> RefResolver:
+        return RefResolver(
+            base_uri=self._base_uri,
+            referrer=self._schema,
+            store=store,  # copied by the resolver
+            handlers={'file': lambda uri: self._load(patched_ajv_file_path(uri))}
+        )
+
+    def is_outdated(self) -> bool:
+        for path, mtime in self.file_mtimes.items():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _load(self, path: str):
+        with open(path, 'r') as file:
+            self.file_mtimes[path] = os.fstat(file.fileno()).st_mtime
+            return json.load(file)
+
+    def _resolve_refs(self, node, resolver: RefResolver, visited: set):
+        """
+        Walks the schema and resolves every `$ref`, so the resolver caches all referenced documents.
+        """
+        if isinstance(node, list):
+            for item in node:
+                self._resolve_refs(item, resolver=resolver, visited=visited)
+        elif isinstance(node, dict):
+            has_id = isinstance(node.get('$id'), str)
+            if has_id:
+                resolver.push_scope(urljoin(resolver.resolution_scope, node['$id']))
+            try:
+                if isinstance(ref := node.get('$ref'), str):
+                    try:
+                        url, resolved = resolver.resolve(ref)
+                    except RefResolutionError:
+                        url, resolved = None, None  # left for validation to report, if this `$ref` is ever reached
+                    if url is not None and url not in visited:
+                        visited.add(url)
+                        resolver.push_scope(url)
+                        try:
+                            self._resolve_refs(resolved, resolver=resolver, visited=visited)
+                        finally:
+                            resolver.pop_scope()
+                for key, value in node.items():
+                    if key not in ('$ref', 'enum', 'const', 'examples'):
+                        self._resolve_refs(value, resolver=resolver, visited=visited)
+            finally:
+                if has_id:
+                    resolver.pop_scope()
+
+
+class ValidatorCache:
+    """
+    Process-wide cache of compiled validators, by schema path. A cached validator is rebuilt
+    when any of the schema files it was built from changes on disk. Lookups and rebuilds are counted
+    in `/metrics` (`validator_cache_lookups`, `validator_cache_invalidations`).
+    """
+    def __init__(self, check_interval: float = 1.0):
+        self._check_interval = check_interval  # seconds between two checks of files modification time
+        self._validators = {}  # schema path -> (CompiledValidator, time of last check)
+        self._lock = threading.Lock()
+
+    def validator(self, schema_path: str) -> CompiledValidator:
+        schema_name = os.path.basename(schema_path)
+        with self._lock:
+            now = time.monotonic()
+            if cached := self._validators.get(schema_path):
+                validator, last_check = cached
+                if now - last_check < self._check_interval:
+                    validator_cache_lookups.inc(schema_name, 'hit')
+                    return validator
+                if not validator.is_outdated():
+                    self._validators[schema_path] = (validator, now)
+                    validator_cache_lookups.inc(schema_name, 'hit')
+                    return validator
+                validator_cache_invalidations.inc(schema_name)
+
+            validator_cache_lookups.inc(schema_name, 'miss')
+            validator = CompiledValidator(schema_path=schema_path)
+            self._validators[schema_path] = (validator, now)
+            return validator
+
+    def clear(self):
+        with self._lock:
+            self._validators.clear()
+
+
+validators = ValidatorCache()
 
 
 def validate_event(event: dict, schema_path: str) -> JSONSchemaValidationResult:
+    with validation_seconds.time(os.path.basename(schema_path)):
+        result = _validate_event(event=event, schema_path=schema_path)
+    _count_results(results=[result], schema_path=schema_path)
+    return result
+
+
+def _validate_event(event: dict, schema_path: str) -> JSONSchemaValidationResult:
     try:
-        schema = json.load(open(schema_path, 'r'))
-        base_path = os.path.abspath(os.path.dirname(schema_path))
-        resolver = RefResolver(base_uri='file://' + base_path + '/', referrer=schema, handlers={'file': patch_ajv_uri})
-        validate(event, schema, resolver=resolver)
+        error = validators.validator(schema_path).validate(event)
+        if error is not None:
+            raise error
         return JSONSchemaValidationResult(schema_path=schema_path, all_ok=True, error=None)
     except ValidationError as error:
         return JSONSchemaValidationResult(schema_path=schema_path, all_ok=False, error=pretty_error_message(error))
@@ -73,3 +210,89 @@ def validate_event(event: dict, schema_path: str) -> JSONSchemaValidationResult:
 
 def pretty_error_message(error: ValidationError) -> str:
     return f'{error.message} ({" → ".join(list(map(lambda p: f"{p}", error.schema_path)))})'
+
+
+def validate_events(events: [dict], schema_path: str) -> [JSONSchemaValidationResult]:
+    """
+    Validates a batch of events against the same schema. Large batches are spread across
+    the validation pool (see `configure_validation_pool()`), small ones are validated in-process.
+    """
+    with validation_seconds.time(os.path.basename(schema_path)):
+        results = validation_pool.validate(events=events, schema_path=schema_path)
+    _count_results(results=results, schema_path=schema_path)
+    return results
+
+
+def _count_results(results: [JSONSchemaValidationResult], schema_path: str):
+    schema_name = os.path.basename(schema_path)
+    validated_events.inc(schema_name, value=len(results))
+    if failures := sum(1 for result in results if not result.all_ok):
+        validation_failures.inc(schema_name, value=failures)
+
+
+def _validate_chunk(events: [dict], schema_path: str) -> [JSONSchemaValidationResult]:
+    # Runs in pool workers: each worker process keeps its own (warm) `validators` cache.
+    return [_validate_event(event=event, schema_path=schema_path) for event in events]
+
+
+class ValidationPool:
+    """
+    Pool of worker processes validating batches of events in parallel.
+    The pool is started lazily, on the first batch large enough to use it.
+
+    Workers are spawned, not forked: the server is multithreaded, so a forked worker could inherit
+    a lock (e.g. of `validators`) held by another thread at fork time and never acquire it.
+    """
+    workers: int  # number of worker processes, `0` to always validate in-process
+    min_batch_size: int  # batches smaller than this are validated in-process
+    timeout: float  # seconds to wait for the pool to validate a batch, before validating it in-process
+
+    def __init__(self, workers: int, min_batch_size: int, timeout: float = 60):
+        self.workers = workers
+        self.min_batch_size = min_batch_size
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def validate(self, events: [dict], schema_path: str) -> [JSONSchemaValidationResult]:
+        if self.workers < 2 or len(events) < self.min_batch_size:
+            return _validate_chunk(events=events, schema_path=schema_path)
+
+        chunk_size = max(self.min_batch_size // 2, -(-len(events) // self.workers))
+        chunks = [events[i:i + chunk_size] for i in range(0, len(events), chunk_size)]
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(_validate_chunk, chunk, schema_path) for chunk in chunks]
+            deadline = time.monotonic() + self.timeout
+            return [result for future in futures
+                    for result in future.result(timeout=max(0.0, deadline - time.monotonic()))]
+        except BrokenProcessPool as error:
+            print(f'⚠️ Validation pool is broken ({error}), validating in-process')
+            self.shutdown()
+            return _validate_chunk(events=events, schema_path=schema_path)
+        except FutureTimeoutError:
+            print(f'⚠️ Validation pool did not validate a batch within {self.timeout}s, validating in-process')
+            self.shutdown()
+            return _validate_chunk(events=events, schema_path=schema_path)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+
+validation_pool = ValidationPool(workers=os.cpu_count() or 1, min_batch_size=200)
+
+
+def configure_validation_pool(workers: int, min_batch_size: int):
+    global validation_pool
+    validation_pool.shutdown()
+    validation_pool = ValidationPool(workers=workers, min_batch_size=min_batch_size)
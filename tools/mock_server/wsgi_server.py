@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+
+# -----------------------------------------------------------
+# Unless explicitly stated otherwise all files in this repository are licensed under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2023-Present Datadog, Inc.
+# -----------------------------------------------------------
+
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from werkzeug.serving import BaseWSGIServer
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server handling requests on a fixed pool of worker threads, without the reloader and debugger
+    of Flask's development server. Requests are queued while all workers are busy.
+
+    Note that `/inspect_stream` and `/inspect_requests?wait=` hold a worker for as long as they are connected.
+    """
+    multithread = True
+    threads: int
+
+    def __init__(self, host: str, port: int, app, threads: int):
+        # Set before binding, as `server_close()` is called if binding fails:
+        self.threads = threads
+        self._executor = None  # created in the process serving requests (after fork, with `processes > 1`)
+        super().__init__(host, port, app)
+
+    def process_request(self, request, client_address):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='mock-server')
+        self._executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def serve(app, host: str, port: int, threads: int, processes: int = 1, on_start: Optional[Callable[[], None]] = None):
+    """
+    Serves `app` until interrupted. Prints the `* Running on` line that `run_integration_test.py` looks for.
+
+    With `processes > 1`, the listening socket is opened once and shared by `processes` forked workers
+    (pre-fork model): the kernel hands each connection to one of them. `on_start()` is called in each
+    process serving requests.
+    """
+    server = PooledWSGIServer(host=host, port=port, app=app, threads=threads)
+    workers = f'{processes} processes of {threads} worker threads' if processes > 1 else f'{threads} worker threads'
+    print(f' * Running on http://{host}:{server.port} ({workers})', flush=True)
+
+    if processes <= 1:
+        _serve_forever(server=server, on_start=on_start)
+        return
+
+    children = []
+    for _ in range(processes):
+        if (pid := os.fork()) == 0:
+            _serve_forever(server=server, on_start=on_start)
+            os._exit(0)
+        children.append(pid)
+    signal.signal(signal.SIGTERM, _interrupt)  # stop workers too when this process is terminated
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+    finally:
+        server.server_close()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def _serve_forever(server: PooledWSGIServer, on_start: Optional[Callable[[], None]]):
+    if on_start:
+        on_start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()